@@ -24,11 +24,12 @@ __copyright__ = 'Copyright 2020 edo0xff'
 
 from . import utils
 from ._music_player import MusicPlayer, MusicQueue
+from ._song_store import SongStore
 from ._conversation import Conversation, Arguments, handle_intention
-
-from pymongo import MongoClient
-
-mongo = MongoClient("mongodb://localhost:27017/")
+from ._context import ContextStore, MemoryContextStore, MongoContextStore
+from ._database import Database
+from ._reminders import ReminderScheduler
+from ._http import HTTPClient, shared as http
 
 #: ErinaBot.Conversation instance.
 conversation = Conversation()
@@ -36,8 +37,19 @@ conversation = Conversation()
 #: ErinaBot.MusicPlayer instance.
 music = MusicPlayer()
 
-#: Mongo database instance.
-db = mongo.ErinaBot
+#: ErinaBot.Database instance, its collections operations are coroutines.
+database = Database("mongodb://localhost:27017/", "ErinaBot")
+
+#: Mongo database (synchronous shim of *database*), ex: *db.songs.find_one()*.
+db = database.sync
+
+
+def __getattr__(name):
+    # the client connects on first use, not on import
+    if name == "mongo":
+        return database.client
+
+    raise AttributeError("module %r has no attribute %r" %(__name__, name))
 
 intention = handle_intention
 '''
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+"""
+The MIT License (MIT)
+
+Copyright (c) 2020 edo0xff
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+import os
+import shlex
+import discord
+import threading
+import subprocess
+
+
+class FFmpegStats():
+    '''
+    Counts the FFmpeg processes spawned by the player audio sources.
+
+    .. attribute:: live(int)
+        FFmpeg processes running right now.
+
+    .. attribute:: spawned(int)
+        FFmpeg processes spawned since the bot started.
+    '''
+    def __init__(self):
+        self.live = 0
+        self.spawned = 0
+        self.lock = threading.Lock()
+
+    def started(self):
+        with self.lock:
+            self.live += 1
+            self.spawned += 1
+
+    def finished(self):
+        with self.lock:
+            self.live -= 1
+
+
+#: FFmpeg processes counters, see MusicPlayer.stats()
+ffmpeg_stats = FFmpegStats()
+
+#: Encoding of the songs recorded while they are streamed, by song extension.
+RECORD_OPTIONS = {
+    '.mp3': "-c:a libmp3lame -b:a 192k -f mp3",
+    '.opus': "-c:a libopus -b:a 128k -f ogg",
+}
+
+#: Seconds FFmpeg gets to finish a recording once the song ended.
+RECORD_WAIT = 5.0
+
+
+class _TrackedFFmpeg():
+    '''
+    Reports the FFmpeg process of an audio source to *ffmpeg_stats*.
+    '''
+    def __init__(self, *args, **kwargs):
+        self.cleanup_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+        self.tracked = True
+        ffmpeg_stats.started()
+
+    def cleanup(self):
+        # voice client and queue worker both call it, at the same time
+        with self.cleanup_lock:
+            if getattr(self, 'tracked', False):
+                self.tracked = False
+                self._finished()
+                ffmpeg_stats.finished()
+
+            super().cleanup()
+
+    def _finished(self):
+        '''
+        Called once, before the FFmpeg process is killed.
+        '''
+
+
+class TrackedFFmpegPCMAudio(_TrackedFFmpeg, discord.FFmpegPCMAudio):
+    '''
+    discord.FFmpegPCMAudio that reports its process to *ffmpeg_stats*.
+
+    If *record* is given FFmpeg also saves what it reads to that file (the
+    song extension, *record_format*, gives its encoding) so a streamed song
+    is downloaded only once. *recorded* tells if the whole song was saved:
+    it was played until the end and FFmpeg exited cleanly.
+    '''
+    def __init__(self, source, record=None, record_format=".mp3", **kwargs):
+        self.record = record
+        self.recorded = False
+        self.eof = False
+
+        if record:
+            # a second output, the options go between discord's pipe:1 output
+            # options and pipe:1 so the pcm output options are given again
+            pcm_options = "-f s16le -ar 48000 -ac 2"
+
+            if hasattr(self, 'BLOCKSIZE'):
+                pcm_options += " -blocksize %i" %(self.BLOCKSIZE)
+
+            kwargs['options'] = " ".join(filter(None, [kwargs.get('options'), "-y -vn",
+                RECORD_OPTIONS[record_format], shlex.quote(record), pcm_options]))
+
+        super().__init__(source, **kwargs)
+
+    def read(self):
+        data = super().read()
+
+        if not data:
+            self.eof = True
+
+        return data
+
+    def _finished(self):
+        if not self.record or not self.eof:
+            return
+
+        try:
+            self._process.wait(timeout=RECORD_WAIT)
+
+        except subprocess.TimeoutExpired:
+            return
+
+        self.recorded = self._process.returncode == 0
+
+
+class TrackedFFmpegOpusAudio(_TrackedFFmpeg, discord.FFmpegOpusAudio):
+    '''
+    discord.FFmpegOpusAudio that reports its process to *ffmpeg_stats*.
+    '''
+
+
+def create_audio_source(metadata, volume=1.0):
+    '''
+    Creates the audio source for a song.
+
+    Ogg/Opus songs (see *MusicPlayer.audio_format*) are sent to discord as they
+    are stored, without decoding nor encoding them again. If the volume is
+    not 1.0 FFmpeg applies it while encoding so python doesn't touch any
+    audio frame, in that case volume changes take effect from the next song.
+
+    Songs with a *'stream_url'* are played from the stream (the player only
+    leaves it for songs that are not cached) and recorded to *'record'* if
+    it is given.
+
+    Args:
+        metadata(dict): Song metadata (see :meth:`MusicPlayer.play`).
+        volume(float): Volume from 0.0 to 1.0.
+
+    Returns:
+        discord.AudioSource: Audio source.
+    '''
+    stream_url = metadata.get('stream_url')
+
+    if not stream_url and metadata['path'] and metadata['path'].endswith(".opus"):
+        if volume == 1.0:
+            return TrackedFFmpegOpusAudio(metadata['path'], codec='copy')
+
+        return TrackedFFmpegOpusAudio(metadata['path'],
+                    options="-vn -filter:a volume=%.2f" %(volume))
+
+    if stream_url:
+        source = TrackedFFmpegPCMAudio(stream_url, record=metadata.get('record'),
+                    record_format=os.path.splitext(metadata['path'] or "")[1] or ".mp3",
+                    before_options="-reconnect 1 -reconnect_streamed 1 -reconnect_delay_max 5")
+
+    else:
+        source = TrackedFFmpegPCMAudio(metadata['path'])
+
+    source = discord.PCMVolumeTransformer(source)
+    source.volume = volume
+
+    return source
@@ -0,0 +1,605 @@
+# -*- coding: utf-8 -*-
+
+"""
+The MIT License (MIT)
+
+Copyright (c) 2020 edo0xff
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+import sys
+import time
+import asyncio
+
+from functools import partial
+from datetime import datetime, timedelta
+from collections import OrderedDict
+from pymongo import UpdateOne, DeleteOne, ASCENDING
+
+#: Var name used for the channel context value (see Conversation.set_context).
+CHANNEL_VALUE = None
+
+# cached marker for vars that are not in the database
+_ABSENT = object()
+
+# local lookups default, a stored None is a value
+_MISSING = object()
+
+
+def _sizeof(value, depth=3):
+    '''
+    Approximated memory size of a context value, containers are followed
+    only a few levels deep.
+    '''
+    size = sys.getsizeof(value)
+
+    if depth == 0:
+        return size
+
+    if isinstance(value, dict):
+        for key, item in value.items():
+            size += _sizeof(key, depth - 1) + _sizeof(item, depth - 1)
+
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        for item in value:
+            size += _sizeof(item, depth - 1)
+
+    return size
+
+
+class ContextStore():
+    '''
+    Interface for the conversation context vars storage. Vars are namespaced
+    by channel, see :class:`MemoryContextStore` and :class:`MongoContextStore`.
+    '''
+    def get(self, channel, var, default=''):
+        '''
+        Gets the value of a context var.
+
+        Args:
+            channel(int): Channel id.
+            var(str): Var name.
+            default(mixed): Returned if the var doesn't exists or it expired.
+
+        Returns:
+            mixed: Var value.
+        '''
+        raise NotImplementedError
+
+    async def get_async(self, channel, var, default=''):
+        '''
+        Same as :meth:`get`, stores that read from a database don't block
+        the event loop.
+        '''
+        return self.get(channel, var, default)
+
+    def set(self, channel, var, value, ttl=None):
+        '''
+        Sets the value of a context var.
+
+        Args:
+            channel(int): Channel id.
+            var(str): Var name.
+            value(mixed): Var value.
+            ttl(float): Seconds the var lives, store ttl by default.
+        '''
+        raise NotImplementedError
+
+    def delete(self, channel, var):
+        '''
+        Removes a context var.
+
+        Args:
+            channel(int): Channel id.
+            var(str): Var name.
+        '''
+        raise NotImplementedError
+
+    def clear(self, channel):
+        '''
+        Removes all the context vars of a channel.
+
+        Args:
+            channel(int): Channel id.
+        '''
+        raise NotImplementedError
+
+    async def clear_async(self, channel):
+        '''
+        Same as :meth:`clear`, stores that write to a database don't block
+        the event loop.
+        '''
+        self.clear(channel)
+
+    def stats(self):
+        '''
+        Store statistics.
+
+        Returns:
+            dict: Depends on the store.
+        '''
+        raise NotImplementedError
+
+
+class MemoryContextStore(ContextStore):
+    '''
+    In process storage for the conversation context vars. Vars live in their
+    channel namespace and expire after *ttl* seconds. When the stored values
+    exceed *max_size* bytes (approximated) the least recently used vars are
+    evicted.
+
+    .. attribute:: evictions(int)
+        Vars removed to keep the store under *max_size*.
+
+    .. attribute:: expirations(int)
+        Vars removed because their ttl expired.
+    '''
+    def __init__(self, ttl=3600, max_size=32 * 1024 * 1024, sweep_interval=60):
+        '''
+        Args:
+            ttl(float): Default seconds a var lives (None to never expire).
+            max_size(int): Memory budget in bytes for the stored values.
+            sweep_interval(float): Seconds between expired vars sweeps.
+        '''
+        self.ttl = ttl
+        self.max_size = max_size
+        self.sweep_interval = sweep_interval
+
+        # (channel, var) -> [value, expiration, size], least recently used first
+        self.entries = OrderedDict()
+        self.channels = {}
+        self.size = 0
+
+        self.evictions = 0
+        self.expirations = 0
+        self.last_sweep = time.monotonic()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, channel, var, default=''):
+        '''
+        Gets the value of a context var.
+
+        Args:
+            channel(int): Channel id.
+            var(str): Var name.
+            default(mixed): Returned if the var doesn't exists or it expired.
+
+        Returns:
+            mixed: Var value.
+        '''
+        key = (channel, var)
+        entry = self.entries.get(key)
+
+        if entry is None:
+            return default
+
+        if entry[1] is not None and entry[1] <= time.monotonic():
+            self.__remove(key)
+            self.expirations += 1
+            return default
+
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def set(self, channel, var, value, ttl=None):
+        '''
+        Sets the value of a context var.
+
+        Args:
+            channel(int): Channel id.
+            var(str): Var name.
+            value(mixed): Var value.
+            ttl(float): Seconds the var lives, store ttl by default.
+        '''
+        key = (channel, var)
+
+        if key in self.entries:
+            self.__remove(key)
+
+        ttl = self.ttl if ttl is None else ttl
+        expiration = None if ttl is None else time.monotonic() + ttl
+        size = _sizeof(value)
+
+        self.entries[key] = [value, expiration, size]
+        self.channels.setdefault(channel, set()).add(var)
+        self.size += size
+
+        self.__sweep()
+
+        while self.size > self.max_size and len(self.entries) > 1:
+            self.__remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def delete(self, channel, var):
+        '''
+        Removes a context var.
+
+        Args:
+            channel(int): Channel id.
+            var(str): Var name.
+        '''
+        key = (channel, var)
+
+        if key in self.entries:
+            self.__remove(key)
+
+    def clear(self, channel):
+        '''
+        Removes all the context vars of a channel.
+
+        Args:
+            channel(int): Channel id.
+        '''
+        for var in list(self.channels.get(channel, ())):
+            self.__remove((channel, var))
+
+    def stats(self):
+        '''
+        Store statistics.
+
+        Returns:
+            dict: *entries*, *channels*, *size* (bytes), *max_size*, *evictions*
+                    and *expirations*.
+        '''
+        return {
+            'entries': len(self.entries),
+            'channels': len(self.channels),
+            'size': self.size,
+            'max_size': self.max_size,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+    def __remove(self, key):
+        entry = self.entries.pop(key)
+        self.size -= entry[2]
+
+        channel, var = key
+        variables = self.channels[channel]
+        variables.discard(var)
+
+        if not variables:
+            del self.channels[channel]
+
+    def __sweep(self):
+        '''
+        Removes the expired vars, at most once every *sweep_interval* seconds.
+        '''
+        now = time.monotonic()
+
+        if now - self.last_sweep < self.sweep_interval:
+            return
+
+        self.last_sweep = now
+
+        expired = [key for key, entry in self.entries.items()
+                    if entry[1] is not None and entry[1] <= now]
+
+        for key in expired:
+            self.__remove(key)
+
+        self.expirations += len(expired)
+
+
+class MongoContextStore(ContextStore):
+    '''
+    Context vars stored in a MongoDB collection so several bot processes
+    share them (a search made in one shard can be played from another one).
+
+    Writes are buffered and sent in a single bulk write every *flush_interval*
+    seconds (or when *batch_size* writes are pending), reads go through a
+    small local cache that keeps vars for *cache_ttl* seconds. In the event
+    loop use :meth:`get_async` and :meth:`clear_async`, they query the
+    database in an executor.
+
+    .. code-block:: python
+
+        erina.conversation.context = erina.MongoContextStore(erina.db.context)
+
+        @client.event
+        async def on_ready():
+            erina.conversation.context.start(client.loop)
+
+    .. note::
+        Values must be BSON serializable (strings, numbers, lists, dicts).
+    '''
+    def __init__(self, collection, ttl=3600, cache_ttl=2.0, flush_interval=0.5,
+                    batch_size=100):
+        '''
+        Args:
+            collection(pymongo.collection.Collection): Context collection.
+            ttl(float): Default seconds a var lives.
+            cache_ttl(float): Seconds a var is served from the local cache.
+            flush_interval(float): Seconds between buffered writes flushes.
+            batch_size(int): Pending writes that trigger a flush.
+        '''
+        self.collection = collection
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        self.cache = MemoryContextStore(ttl=cache_ttl)
+        # (channel, var) -> (value, expiration) or None for deletions
+        self.pending = OrderedDict()
+        self.task = None
+        self.wakeup = None
+        # held by flush_async and clear_async, a clear waits for the flush
+        # in flight so it can't write back the cleared vars
+        self.write_lock = None
+        # channels being cleared -> clears in progress
+        self.clearing = {}
+
+        self.flushes = 0
+        self.writes = 0
+        self.hits = 0
+        self.misses = 0
+
+        self.collection.create_index([('channel', ASCENDING), ('var', ASCENDING)], unique=True)
+        self.collection.create_index('expiration', expireAfterSeconds=0)
+
+    def start(self, loop):
+        '''
+        Starts the task that flushes buffered writes.
+
+        Args:
+            loop(asyncio.AbstractEventLoop): We get this from *client.loop*.
+
+        Returns:
+            asyncio.Task: Flush task.
+        '''
+        if self.task and not self.task.done():
+            return self.task
+
+        self.wakeup = asyncio.Event()
+        self.task = loop.create_task(self.__flush_worker())
+        return self.task
+
+    async def __flush_worker(self):
+        while True:
+            try:
+                # woken up early when batch_size writes are pending
+                await asyncio.wait_for(self.wakeup.wait(), self.flush_interval)
+
+            except asyncio.TimeoutError:
+                pass
+
+            self.wakeup.clear()
+
+            try:
+                await self.flush_async()
+
+            except Exception as e:
+                print("ContextError: couldn't flush context vars: %s" %(e))
+
+    def get(self, channel, var, default=''):
+        value = self.__local(channel, var, default)
+
+        if value is _MISSING:
+            value = self.__cached(channel, var, self.__fetch(channel, var), default)
+
+        return value
+
+    async def get_async(self, channel, var, default=''):
+        value = self.__local(channel, var, default)
+
+        if value is _MISSING:
+            document = await asyncio.get_event_loop().run_in_executor(None,
+                            self.__fetch, channel, var)
+            value = self.__cached(channel, var, document, default)
+
+        return value
+
+    def set(self, channel, var, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expiration = datetime.utcnow() + timedelta(seconds=ttl)
+
+        self.__buffer((channel, var), (value, expiration))
+        self.cache.set(channel, var, value)
+
+    def delete(self, channel, var):
+        self.__buffer((channel, var), None)
+        self.cache.delete(channel, var)
+
+    def clear(self, channel):
+        self.__drop(channel)
+        self.collection.delete_many({'channel': channel})
+
+    async def clear_async(self, channel):
+        self.__drop(channel)
+        self.clearing[channel] = self.clearing.get(channel, 0) + 1
+
+        try:
+            async with self.__write_lock():
+                await asyncio.get_event_loop().run_in_executor(None,
+                    partial(self.collection.delete_many, {'channel': channel}))
+
+        finally:
+            self.clearing[channel] -= 1
+
+            if not self.clearing[channel]:
+                del self.clearing[channel]
+
+    def flush(self):
+        '''
+        Sends the buffered writes to the database in a single bulk write
+        (blocking, the flush task uses :meth:`flush_async`).
+        '''
+        pending, operations = self.__take()
+
+        if not operations:
+            return
+
+        try:
+            self.collection.bulk_write(operations, ordered=False)
+
+        except Exception:
+            self.__restore(pending)
+            raise
+
+        self.flushes += 1
+        self.writes += len(operations)
+
+    async def flush_async(self):
+        '''
+        Same as :meth:`flush` but the bulk write runs in an executor. The
+        buffer is only touched in the event loop thread.
+        '''
+        async with self.__write_lock():
+            pending, operations = self.__take()
+
+            if not operations:
+                return
+
+            try:
+                await asyncio.get_event_loop().run_in_executor(None,
+                    partial(self.collection.bulk_write, operations, ordered=False))
+
+            except Exception:
+                self.__restore(pending)
+                raise
+
+            self.flushes += 1
+            self.writes += len(operations)
+
+    def __take(self):
+        '''
+        Takes the buffered writes.
+
+        Returns:
+            tuple(pending, operations): Taken writes and their bulk operations.
+        '''
+        pending, self.pending = self.pending, OrderedDict()
+        operations = []
+
+        for (channel, var), write in pending.items():
+            query = {'channel': channel, 'var': var}
+
+            if write is None:
+                operations.append(DeleteOne(query))
+
+            else:
+                value, expiration = write
+                operations.append(UpdateOne(query,
+                    {'$set': {'value': value, 'expiration': expiration}}, upsert=True))
+
+        return pending, operations
+
+    def __local(self, channel, var, default):
+        '''
+        Looks for a var in the pending writes and the local cache.
+
+        Returns:
+            mixed: Var value, *_MISSING* if the database must be queried.
+        '''
+        key = (channel, var)
+
+        if key in self.pending:
+            write = self.pending[key]
+
+            if write is None or write[1] <= datetime.utcnow():
+                return default
+
+            return write[0]
+
+        # its documents are being deleted
+        if channel in self.clearing:
+            return default
+
+        value = self.cache.get(channel, var, _MISSING)
+
+        if value is not _MISSING:
+            self.hits += 1
+            return default if value is _ABSENT else value
+
+        self.misses += 1
+        return _MISSING
+
+    def __fetch(self, channel, var):
+        '''
+        Reads a var from the database (blocking).
+
+        Returns:
+            mixed: Var value or *_ABSENT*.
+        '''
+        document = self.collection.find_one({'channel': channel, 'var': var})
+
+        # the ttl monitor only runs once a minute, expired vars can be there
+        if not document or document['expiration'] <= datetime.utcnow():
+            return _ABSENT
+
+        return document['value']
+
+    def __cached(self, channel, var, value, default):
+        # it could be written or cleared while it was read
+        if (channel, var) not in self.pending and channel not in self.clearing:
+            self.cache.set(channel, var, value)
+
+        return default if value is _ABSENT else value
+
+    def __drop(self, channel):
+        '''
+        Drops the pending writes and the cached vars of a channel.
+        '''
+        for key in [key for key in self.pending if key[0] == channel]:
+            del self.pending[key]
+
+        self.cache.clear(channel)
+
+    def __write_lock(self):
+        # created in the event loop, not when the store is imported
+        if self.write_lock is None:
+            self.write_lock = asyncio.Lock()
+
+        return self.write_lock
+
+    def __restore(self, pending):
+        # keep them for the next flush unless they were written again
+        for key, write in pending.items():
+            self.pending.setdefault(key, write)
+
+    def stats(self):
+        '''
+        Store statistics.
+
+        Returns:
+            dict: *pending* writes, *flushes*, *writes*, cache *hits* and
+                    *misses* and the local *cache* stats.
+        '''
+        return {
+            'pending': len(self.pending),
+            'flushes': self.flushes,
+            'writes': self.writes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'cache': self.cache.stats(),
+        }
+
+    def __buffer(self, key, write):
+        self.pending.pop(key, None)
+        self.pending[key] = write
+
+        if len(self.pending) >= self.batch_size:
+            if self.task and not self.task.done():
+                self.wakeup.set()
+
+            else:
+                self.flush()
@@ -25,17 +25,23 @@ DEALINGS IN THE SOFTWARE.
 """
 
 import re
-import yaml
-import time
-import string
+import asyncio
 import random
-import unidecode
-import Levenshtein
+import inspect
 
 from discord import Embed, Color
 
+from ._matcher import matchers, distance_matrix
+from ._dictionary import compile_dictionary
+from ._normalizer import TextNormalizer, BOT_NAME
+from ._context import MemoryContextStore, CHANNEL_VALUE
+
 intention_callbacks = {}
 intentions_help = []
+help_embeds = []
+
+#: Embed description length limit.
+HELP_PAGE_SIZE = 4096
 
 
 class Arguments():
@@ -112,11 +118,27 @@ class Conversation():
     .. important::
         You will use this class throw **ErinaBot.conversation** instance.
     '''
-    def __init__(self):
+    def __init__(self, matcher='bktree', cache_dir='.erina_cache', context=None):
         '''Initializes dictionary and context vars.
+
+        Args:
+            matcher(str): Intention matcher backend, *bktree* (default) or
+                            *linear*. Both return the same intentions, *linear*
+                            just compares the message against every phrase.
+            cache_dir(str): Directory where loaded dictionaries are cached
+                            (None to disable it), see :meth:`load_dictionary`.
+            context(ErinaBot.ContextStore): Context vars storage, in memory by
+                            default (vars expire after an hour). Use
+                            ErinaBot.MongoContextStore to share it between
+                            bot processes.
         '''
         self.dictionary = []
-        self.context = {}
+        self.sources = []
+        self.context = context if context is not None else MemoryContextStore()
+        self.matcher = matcher
+        self.cache_dir = cache_dir
+        self.normalizer = TextNormalizer()
+        self.watcher = None
 
     def __clear_string(self, text):
         '''Removes strings between quotes also removes punctuations
@@ -126,19 +148,7 @@ class Conversation():
         Args:
             text (str): String to clear.
         '''
-        text = text.lower()
-        text = unidecode.unidecode(text)
-        text = re.sub(r'(\"|\')(.+)(\"|\')', "", text)
-        text = re.sub(r'([0-9]+)', "", text)
-        text = re.sub(r'(^e+r+i+\s+)|(\s+e+r+i+$)|(\s+e+r+i+\s+)', "", text)
-        text = re.sub(
-                r'(https?://)?(www\.)?'
-                '(youtube|youtu|youtube-nocookie)\.(com|be)/'
-                '(watch\?v=|embed/|v/|.+\?v=)?([^&=%\?]{11})', "", text)
-
-        text = ''.join([word for word in text if word not in string.punctuation])
-
-        return text
+        return self.normalizer(text)
 
     def get_context(self, ctx):
         '''Gets the context value for the especified context.
@@ -149,12 +159,13 @@ class Conversation():
         Returns:
             str: The context value.
         '''
-        key = "%s" %(ctx.channel.id)
-        if key in self.context.keys():
-            return self.context[key]
+        return self.context.get(ctx.channel.id, CHANNEL_VALUE)
 
-        else:
-            return ''
+    async def get_context_async(self, ctx):
+        '''Same as :meth:`get_context`, it doesn't block the event loop
+        if the context store reads from a database.
+        '''
+        return await self.context.get_async(ctx.channel.id, CHANNEL_VALUE)
 
     def set_context(self, ctx, value):
         '''Sets the context value for the especified context.
@@ -163,8 +174,7 @@ class Conversation():
             ctx (discord.Message): Context.
             value (str): Context value.
         '''
-        key = "%s" %(ctx.channel.id)
-        self.context[key] = value
+        self.context.set(ctx.channel.id, CHANNEL_VALUE, value)
 
     def clear_context(self, ctx):
         '''Clears the context value for the especified context.
@@ -172,8 +182,7 @@ class Conversation():
         Args:
             ctx (discord.Message): Context.
         '''
-        key = "%s" %(ctx.channel.id)
-        self.context[key] = ''
+        self.context.delete(ctx.channel.id, CHANNEL_VALUE)
 
     def set_context_var(self, ctx, var, val):
         '''Creates a context var for the especified context.
@@ -183,8 +192,7 @@ class Conversation():
             var (str): Var name.
             val (mixed): Var value, it could be whatever you want.
         '''
-        key = "%s.%s" %(ctx.channel.id, var)
-        self.context[key] = val
+        self.context.set(ctx.channel.id, var, val)
 
     def get_context_var(self, ctx, var):
         '''Gets the value of the especified context var.
@@ -196,32 +204,151 @@ class Conversation():
         Returns:
             mixed: Var value.
         '''
-        key = "%s.%s" %(ctx.channel.id, var)
-        if key in self.context.keys():
-            return self.context[key]
+        return self.context.get(ctx.channel.id, var)
 
-        else:
-            return ''
+    async def get_context_var_async(self, ctx, var):
+        '''Same as :meth:`get_context_var`, it doesn't block the event
+        loop if the context store reads from a database.
+        '''
+        return await self.context.get_async(ctx.channel.id, var)
 
     def load_dictionary(self, file):
         '''Loads a dictionary of intentions or dialogs. Must be a .yml file.
         see *intentions.yml* and *dialogs.yml* for reference.
 
+        The cleaned phrases and their index are cached in *cache_dir*, next
+        starts load them from there while the .yml file doesn't change.
+
         Args:
             file(str): Intentions or Dialogs disctionary path.
         '''
-        file = open(file)
-        content = file.read()
-        file.close()
+        compiled = compile_dictionary(file, self.__clear_string, self.matcher,
+                                        matchers[self.matcher], self.cache_dir)
+
+        self.__swap_sources(self.sources + [compiled])
+
+    def reload_dictionaries(self):
+        '''Reloads the dictionary files that changed since they were loaded.
+        Only the phrases of the changed files are cleaned and indexed again.
+
+        Returns:
+            list[str]: Reloaded files.
+        '''
+        sources, reloaded = self.__compile_changed(self.sources)
+
+        if reloaded:
+            self.__swap_sources(sources)
+
+        return reloaded
+
+    def watch_dictionaries(self, loop, interval=5.0):
+        '''Starts a task that watches the loaded dictionary files and reloads
+        them when they change, so there is no need to restart the bot after
+        editing *dialogs.yml*.
+
+        Files are compiled in an executor, messages keep being recognized with
+        the old dictionary until the new one is swapped in.
+
+        Args:
+            loop(asyncio.AbstractEventLoop): We get this from *client.loop*.
+            interval(float): Seconds between checks.
+
+        Returns:
+            asyncio.Task: Watcher task.
+        '''
+        if self.watcher and not self.watcher.done():
+            return self.watcher
 
-        loaded = yaml.load(content)
+        self.watcher = loop.create_task(self.__watch_worker(loop, interval))
+        return self.watcher
 
-        for question, answer in loaded:
-            if isinstance(question, list):
-                for sub_question in question:
-                    self.dictionary.append([self.__clear_string(sub_question), answer])
-            else:
-                self.dictionary.append([self.__clear_string(question), answer])
+    async def __watch_worker(self, loop, interval):
+        '''Checks the dictionary files every *interval* seconds.
+        '''
+        while True:
+            await asyncio.sleep(interval)
+
+            sources = self.sources
+            changed, reloaded = await loop.run_in_executor(None, self.__compile_changed, sources)
+
+            # a dictionary was loaded meanwhile, try again in the next check
+            if not reloaded or self.sources is not sources:
+                continue
+
+            self.__swap_sources(changed)
+            print("Reloaded dictionaries: %s" %(", ".join(reloaded)))
+
+    def __compile_changed(self, sources):
+        '''Compiles again the changed dictionary files.
+
+        Args:
+            sources(list): Loaded dictionaries.
+
+        Returns:
+            tuple(sources, reloaded): New dictionaries list and reloaded files.
+        '''
+        compiled = []
+        reloaded = []
+
+        for source in sources:
+            if source.is_stale():
+                try:
+                    source = compile_dictionary(source.file, self.__clear_string, self.matcher,
+                                                matchers[self.matcher], self.cache_dir)
+                    reloaded.append(source.file)
+
+                except Exception as e:
+                    print("ConversationError: couldn't reload '%s': %s" %(source.file, e))
+
+            compiled.append(source)
+
+        return compiled, reloaded
+
+    def __swap_sources(self, sources):
+        '''Replaces the loaded dictionaries. Both attributes are assigned at
+        once and recognition doesn't await between reading them, so a message
+        is always recognized against one consistent dictionary.
+
+        Args:
+            sources(list): Compiled dictionaries.
+        '''
+        dictionary = []
+        for source in sources:
+            dictionary.extend(source.entries)
+
+        self.sources, self.dictionary = sources, dictionary
+
+    def __nearest(self, text):
+        '''Search for the closest dictionary phrase to the given string.
+
+        Each loaded file has its own index, files loaded later must be strictly
+        closer to win (same as a single scan over the whole dictionary).
+
+        Args:
+            text (str): Cleaned string.
+
+        Returns:
+            tuple(index, distance): Dictionary position and distance (None, None
+                                    if there is no dictionary loaded).
+        '''
+        best_index = None
+        best_distance = None
+        offset = 0
+
+        for source in self.sources:
+            limit = None if best_distance is None else best_distance - 1
+            index, distance = source.matcher.nearest(text, limit)
+
+            if index is not None:
+                best_index = offset + index
+                best_distance = distance
+
+                if distance == 0:
+                    break
+
+            offset += len(source.entries)
+
+        return best_index, best_distance
 
     def talking_to_me(self, text):
         '''Look for the bot's name (eri) in the given string.
@@ -233,13 +360,51 @@ class Conversation():
             boolean: True if the bot's name is in the given string.
         '''
         text = text.lower()
-        regex = re.search(r'(^e+r+i+\s+)|(\s+e+r+i+$)|(\s+e+r+i+\s+)', text)
+        regex = BOT_NAME.search(text)
 
         if regex:
             return True
 
         return False
 
+    def classify_batch(self, texts, clean=True):
+        '''Recognizes the intention of many strings at once without calling
+        any intention handler or sending anything. Useful to replay message
+        logs against new dialog files.
+
+        Distances for the whole batch are computed in one pass (see
+        *ErinaBot._matcher.distance_matrix*) and repeated strings are only
+        computed once. Results are the same that :meth:`recognize` would get.
+
+        Args:
+            texts(list[str]): Messages content.
+            clean(bool): Set it to False if the given strings are already
+                            cleaned.
+
+        Returns:
+            list[tuple(intention, distance)]: For each string the recognized
+                                                intention (or dialog answers)
+                                                and its levenshtein distance.
+        '''
+        if not self.dictionary:
+            return [(None, None) for text in texts]
+
+        if clean:
+            texts = [self.__clear_string(text) for text in texts]
+
+        unique = list(dict.fromkeys(texts))
+        phrases = [question for question, answer in self.dictionary]
+
+        distances = distance_matrix(unique, phrases)
+        indexes = distances.argmin(axis=1)
+
+        results = {}
+        for i, text in enumerate(unique):
+            index = indexes[i]
+            results[text] = (self.dictionary[index][1], int(distances[i, index]))
+
+        return [results[text] for text in texts]
+
     async def recognize(self, msg):
         '''Reconize the intention of the given string and call the appropriate
         intention handler. If the recognition result is a dialog not and intention
@@ -274,28 +439,18 @@ class Conversation():
         Args:
             msg (discord.Message): Message to recognize.
         '''
-        min_distance = 9999
-        index = 0
-
         text = self.__clear_string(msg.content)
+        index, distance = self.__nearest(text)
 
-        for i in range(len(self.dictionary)):
-            question = self.dictionary[i][0]
-            distance = Levenshtein.distance(question, text)
-
-            if distance < min_distance:
-                min_distance = distance
-                index =  i
+        if index is None:
+            print("ConversationError: there is no dictionary loaded")
+            return
 
         intention = self.dictionary[index][1]
 
         if intention == 'help':
-            for help in intentions_help:
-                embed = Embed(description=help,
-                                color=Color.purple())
-
+            for embed in help_embeds:
                 await msg.channel.send(embed=embed)
-                time.sleep(1)
 
             return
 
@@ -317,10 +472,47 @@ def handle_intention(func):
     '''
     intention_callbacks[func.__name__] = func
     if func.__doc__:
-        intentions_help.append(func.__doc__)
+        # docstrings are indented like the code
+        intentions_help.append(inspect.cleandoc(func.__doc__))
+        help_embeds[:] = [Embed(description=page, color=Color.purple())
+                            for page in _help_pages(intentions_help)]
 
     return func
 
+def _help_pages(helps, size=HELP_PAGE_SIZE):
+    '''Joins the intention handlers docs in as few embed descriptions as
+    possible, docs longer than an embed are splitted by lines.
+
+    Args:
+        helps(list[str]): Intention handlers docs.
+        size(int): Max page length.
+
+    Returns:
+        list[str]: Pages.
+    '''
+    pages = []
+    page = ""
+
+    for help in helps:
+        # a blank line between docs
+        help += "\n\n"
+
+        for line in help.splitlines(keepends=True) if len(help) > size else [help]:
+            if page and len(page) + len(line) > size:
+                pages.append(page)
+                page = ""
+
+            while len(line) > size:
+                pages.append(line[:size])
+                line = line[size:]
+
+            page += line
+
+    if page:
+        pages.append(page)
+
+    return [page.rstrip() for page in pages]
+
 if __name__ == "__main__":
     conversation = Conversation()
 
@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+
+"""
+The MIT License (MIT)
+
+Copyright (c) 2020 edo0xff
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+import time
+import asyncio
+import threading
+
+from functools import partial
+from pymongo import MongoClient
+from concurrent.futures import ThreadPoolExecutor
+
+
+class OperationStats():
+    '''
+    Latency of the database operations, by *collection.operation*.
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        # name -> [count, errors, total seconds, max seconds]
+        self.operations = {}
+
+    def record(self, name, elapsed, failed=False):
+        with self.lock:
+            operation = self.operations.setdefault(name, [0, 0, 0.0, 0.0])
+            operation[0] += 1
+            operation[1] += 1 if failed else 0
+            operation[2] += elapsed
+            operation[3] = max(operation[3], elapsed)
+
+    def summary(self):
+        '''
+        Returns:
+            dict: *collection.operation* -> *count*, *errors*, *avg_ms* and *max_ms*.
+        '''
+        with self.lock:
+            return {name: {
+                        'count': count,
+                        'errors': errors,
+                        'avg_ms': total / count * 1000,
+                        'max_ms': maximum * 1000,
+                    } for name, (count, errors, total, maximum) in self.operations.items()}
+
+
+class Collection():
+    '''
+    Synchronous collection, it has the pymongo Collection methods (calls are
+    timed in the database stats). Existing code keeps using it through
+    *ErinaBot.db*:
+
+    .. code-block:: python
+
+        erina.db.notifications.insert_one(notification)
+    '''
+    def __init__(self, database, name):
+        self._database = database
+        self._name = name
+
+    @property
+    def collection(self):
+        '''
+        pymongo.collection.Collection: The wrapped collection.
+        '''
+        return self._database.client[self._database.name][self._name]
+
+    def __getattr__(self, attribute):
+        value = getattr(self.collection, attribute)
+
+        if not callable(value) or attribute.startswith('_'):
+            return value
+
+        return partial(self._database.timed, "%s.%s" %(self._name, attribute), value)
+
+    def __getitem__(self, name):
+        return self.collection[name]
+
+    def find_all(self, *args, **kwargs):
+        '''
+        Like *find* but the cursor is read (and timed) before returning.
+
+        Returns:
+            array[dict]: Found documents.
+        '''
+        return self._database.timed("%s.find" %(self._name),
+                    lambda: list(self.collection.find(*args, **kwargs)))
+
+
+class AsyncCollection():
+    '''
+    Asynchronous collection, every operation runs in the database executor so
+    the event loop is never blocked waiting for MongoDB.
+
+    .. code-block:: python
+
+        await erina.database.notifications.insert_one(notification)
+        notifications = await erina.database.notifications.find({'channel': channel})
+    '''
+    def __init__(self, database, name):
+        self.database = database
+        self.name = name
+        self.sync = Collection(database, name)
+
+    async def run(self, operation, *args, **kwargs):
+        '''
+        Runs any pymongo Collection method in the database executor.
+
+        Args:
+            operation(str): Method name.
+
+        Returns:
+            mixed: The method result.
+        '''
+        function = partial(getattr(self.sync, operation), *args, **kwargs)
+        return await asyncio.get_event_loop().run_in_executor(self.database.executor, function)
+
+    async def find(self, *args, **kwargs):
+        '''
+        Like pymongo *find* but the cursor is read in the executor.
+
+        Returns:
+            array[dict]: Found documents.
+        '''
+        return await self.run('find_all', *args, **kwargs)
+
+    async def find_one(self, *args, **kwargs):
+        return await self.run('find_one', *args, **kwargs)
+
+    async def insert_one(self, *args, **kwargs):
+        return await self.run('insert_one', *args, **kwargs)
+
+    async def insert_many(self, *args, **kwargs):
+        return await self.run('insert_many', *args, **kwargs)
+
+    async def update_one(self, *args, **kwargs):
+        return await self.run('update_one', *args, **kwargs)
+
+    async def update_many(self, *args, **kwargs):
+        return await self.run('update_many', *args, **kwargs)
+
+    async def delete_one(self, *args, **kwargs):
+        return await self.run('delete_one', *args, **kwargs)
+
+    async def delete_many(self, *args, **kwargs):
+        return await self.run('delete_many', *args, **kwargs)
+
+    async def bulk_write(self, *args, **kwargs):
+        return await self.run('bulk_write', *args, **kwargs)
+
+    async def count_documents(self, *args, **kwargs):
+        return await self.run('count_documents', *args, **kwargs)
+
+    async def create_index(self, *args, **kwargs):
+        return await self.run('create_index', *args, **kwargs)
+
+
+class SyncDatabase():
+    '''
+    Synchronous shim of :class:`Database`, collections are attributes like in
+    a pymongo Database (see :class:`Collection`).
+    '''
+    def __init__(self, database):
+        self._database = database
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        return self._database.collection(name).sync
+
+    def __getitem__(self, name):
+        return self._database.collection(name).sync
+
+
+class Database():
+    '''
+    MongoDB access for the bot. The client is created (and connects) the
+    first time a collection is used, not when ErinaBot is imported.
+    Operations are timed, see :meth:`stats`.
+
+    Collections are attributes, their operations are coroutines (see
+    :class:`AsyncCollection`), *sync* has the blocking ones:
+
+    .. code-block:: python
+
+        song = await erina.database.songs.find_one({'video_id': video_id})
+        song = erina.database.sync.songs.find_one({'video_id': video_id})
+    '''
+    def __init__(self, uri="mongodb://localhost:27017/", name="ErinaBot", max_workers=8,
+                    max_pool_size=20, min_pool_size=0, timeout=5.0):
+        '''
+        Args:
+            uri(str): MongoDB connection uri.
+            name(str): Database name.
+            max_workers(int): Operations running at once (executor threads).
+            max_pool_size(int): Max connections to MongoDB.
+            min_pool_size(int): Connections kept open while idle.
+            timeout(float): Seconds to connect or to find a server before
+                            an operation fails.
+        '''
+        self.uri = uri
+        self.name = name
+        self.options = {
+            'maxPoolSize': max_pool_size,
+            'minPoolSize': min_pool_size,
+            'connectTimeoutMS': int(timeout * 1000),
+            'serverSelectionTimeoutMS': int(timeout * 1000),
+        }
+
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.operation_stats = OperationStats()
+        self.collections = {}
+        self.sync = SyncDatabase(self)
+
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        '''
+        pymongo.MongoClient: Created on first use.
+        '''
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = MongoClient(self.uri, **self.options)
+
+        return self._client
+
+    def collection(self, name):
+        '''
+        Gets a collection.
+
+        Args:
+            name(str): Collection name.
+
+        Returns:
+            ErinaBot._database.AsyncCollection: The collection.
+        '''
+        if name not in self.collections:
+            self.collections[name] = AsyncCollection(self, name)
+
+        return self.collections[name]
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        return self.collection(name)
+
+    def __getitem__(self, name):
+        return self.collection(name)
+
+    def timed(self, name, function, *args, **kwargs):
+        '''
+        Calls a pymongo function recording its latency.
+        '''
+        start = time.perf_counter()
+        failed = True
+
+        try:
+            result = function(*args, **kwargs)
+            failed = False
+
+        finally:
+            self.operation_stats.record(name, time.perf_counter() - start, failed)
+
+        return result
+
+    def stats(self):
+        '''
+        Operations latency.
+
+        Returns:
+            dict: *collection.operation* -> *count*, *errors*, *avg_ms* and *max_ms*.
+        '''
+        return self.operation_stats.summary()
+
+    def close(self):
+        '''
+        Closes the connections and stops the executor.
+        '''
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+
+"""
+The MIT License (MIT)
+
+Copyright (c) 2020 edo0xff
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+import os
+import yaml
+import pickle
+import hashlib
+
+#: Bump it when the normalizer or the matchers change, old caches are ignored.
+CACHE_VERSION = 1
+
+
+class CompiledDictionary():
+    '''
+    A loaded intentions or dialogs file: its cleaned phrases and the matcher
+    index built for them.
+
+    .. attribute:: file(str)
+        Absolute path of the .yml file.
+
+    .. attribute:: entries(list)
+        List of [cleaned phrase, answer] pairs, answer is the intention name
+        or the list of dialog answers.
+
+    .. attribute:: matcher(object)
+        Matcher index of the phrases, indexes are positions in *entries*.
+
+    .. attribute:: mtime(float), size(int), digest(str)
+        Modification time, size and sha1 of the file when it was compiled.
+    '''
+    def __init__(self, file, entries, matcher, mtime, size, digest):
+        self.file = file
+        self.entries = entries
+        self.matcher = matcher
+        self.mtime = mtime
+        self.size = size
+        self.digest = digest
+
+    def is_stale(self):
+        '''
+        Checks if the file changed since it was compiled.
+
+        Returns:
+            boolean: True if the file was modified (False if it was removed).
+        '''
+        try:
+            stat = os.stat(self.file)
+
+            if stat.st_mtime == self.mtime and stat.st_size == self.size:
+                return False
+
+            with open(self.file, 'rb') as f:
+                content = f.read()
+
+        except OSError:
+            return False
+
+        return hashlib.sha1(content).hexdigest() != self.digest
+
+
+def _cache_path(cache_dir, file):
+    name = hashlib.sha1(file.encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, "%s.pickle" %(name))
+
+
+def _load_cache(path, file, matcher_name, stat, content):
+    '''
+    Loads a compiled dictionary from the cache. Returns None if there is no
+    cache or it doesn't belong to the current file contents.
+    '''
+    try:
+        with open(path, 'rb') as f:
+            header = pickle.load(f)
+
+            if header['version'] != CACHE_VERSION or header['file'] != file\
+                or header['matcher'] != matcher_name or header['size'] != stat.st_size:
+                return None
+
+            # mtime changes on checkouts, the content hash is the one in charge
+            if header['mtime'] != stat.st_mtime\
+                and header['digest'] != hashlib.sha1(content()).hexdigest():
+                return None
+
+            entries, matcher = pickle.load(f)
+
+    except (OSError, EOFError, KeyError, TypeError, AttributeError,
+            ImportError, pickle.UnpicklingError):
+        return None
+
+    return CompiledDictionary(file, entries, matcher, stat.st_mtime,
+                                stat.st_size, header['digest'])
+
+
+def _save_cache(path, compiled, matcher_name):
+    header = {
+        'version': CACHE_VERSION,
+        'file': compiled.file,
+        'matcher': matcher_name,
+        'mtime': compiled.mtime,
+        'size': compiled.size,
+        'digest': compiled.digest,
+    }
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # write and rename so a crash never leaves a half written cache
+    tmp_path = "%s.%i.tmp" %(path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(header, f, pickle.HIGHEST_PROTOCOL)
+        pickle.dump((compiled.entries, compiled.matcher), f, pickle.HIGHEST_PROTOCOL)
+
+    os.replace(tmp_path, path)
+
+
+def compile_dictionary(file, normalizer, matcher_name, matcher_class, cache_dir=None):
+    '''
+    Loads an intentions or dialogs .yml file, cleans its phrases and indexes
+    them. If *cache_dir* is given the result is stored there and reused while
+    the file doesn't change, so YAML parsing and phrase cleaning are skipped.
+
+    Args:
+        file(str): Dictionary path.
+        normalizer(callable): Phrase cleaning function.
+        matcher_name(str): Matcher backend name (part of the cache key).
+        matcher_class(type): Matcher backend.
+        cache_dir(str): Directory for the compiled dictionaries (None disables
+                        the cache).
+
+    Returns:
+        ErinaBot._dictionary.CompiledDictionary: Compiled dictionary.
+    '''
+    file = os.path.abspath(file)
+    stat = os.stat(file)
+    content = None
+
+    def read():
+        nonlocal content
+        if content is None:
+            with open(file, 'rb') as f:
+                content = f.read()
+
+        return content
+
+    if cache_dir:
+        path = _cache_path(cache_dir, file)
+        compiled = _load_cache(path, file, matcher_name, stat, read)
+
+        if compiled:
+            return compiled
+
+    loaded = yaml.safe_load(read().decode('utf-8'))
+
+    entries = []
+    matcher = matcher_class()
+
+    for question, answer in loaded:
+        if not isinstance(question, list):
+            question = [question]
+
+        for sub_question in question:
+            phrase = normalizer(sub_question)
+            matcher.add(phrase, len(entries))
+            entries.append([phrase, answer])
+
+    compiled = CompiledDictionary(file, entries, matcher, stat.st_mtime,
+                                    stat.st_size, hashlib.sha1(read()).hexdigest())
+
+    if cache_dir:
+        try:
+            _save_cache(path, compiled, matcher_name)
+
+        except OSError as e:
+            print("DictionaryError: couldn't write cache for '%s': %s" %(file, e))
+
+    return compiled
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+"""
+The MIT License (MIT)
+
+Copyright (c) 2020 edo0xff
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+import lxml.html
+
+from lxml import etree
+
+# pages are decoded by the http client, lxml gets them back as utf-8 bytes
+# (str with an xml encoding declaration is rejected by lxml)
+PARSER = lxml.html.HTMLParser(encoding='utf-8')
+
+
+def _has_class(name):
+    return "contains(concat(' ', normalize-space(@class), ' '), ' %s ')" %(name)
+
+# compiled once, they are used on every page. String results are plain str,
+# lxml "smart strings" keep a reference to their element (the whole tree)
+COVID_ROWS = etree.XPath("(//table)[1]//tr")
+CELLS = etree.XPath("./td")
+POSTS = etree.XPath("//post")
+MEMES = etree.XPath("//article[%s]" %(_has_class('gallery-item')))
+FIRST_IMG_SRC = etree.XPath("(.//img)[1]/@src", smart_strings=False)
+JOKE = etree.XPath("(//div[%s])[1]" %(_has_class('chiste')))
+YT_RESULTS = etree.XPath("//*[%s]" %(_has_class('yt-uix-tile-link')))
+
+
+def document(html):
+    '''
+    Parses a page with lxml (much faster and lighter than a BeautifulSoup
+    tree), only the elements needed are looked up with XPath.
+
+    Args:
+        html(str): Page.
+
+    Returns:
+        lxml.html.HtmlElement: Page root, None if the page is empty.
+    '''
+    if not html or not html.strip():
+        return None
+
+    return lxml.html.fromstring(html.encode('utf-8'), parser=PARSER)
+
+
+def covid_rows(html):
+    '''
+    Gets the cells text of the first table rows.
+
+    Returns:
+        array[array[str]]: Rows cells.
+    '''
+    root = document(html)
+
+    if root is None:
+        raise ValueError("empty page")
+
+    rows = COVID_ROWS(root)
+
+    if not rows:
+        raise ValueError("table not found")
+
+    return [[str(cell.text_content()).strip() for cell in CELLS(row)] for row in rows]
+
+
+def posts(html):
+    '''
+    Returns:
+        array[tuple(file_url, preview_url)]: Posts in a rule34 api page.
+    '''
+    root = document(html)
+
+    if root is None:
+        return []
+
+    return [(post.get('file_url'), post.get('preview_url')) for post in POSTS(root)]
+
+
+def memes(html):
+    '''
+    Returns:
+        array[str]: Memes urls in a memedroid page.
+    '''
+    root = document(html)
+
+    if root is None:
+        return []
+
+    urls = []
+
+    for article in MEMES(root):
+        src = FIRST_IMG_SRC(article)
+
+        if src:
+            urls.append(src[0])
+
+    return urls
+
+
+def jokes(html):
+    '''
+    Returns:
+        array[str]: Jokes in a chistes.com page.
+    '''
+    root = document(html)
+    box = JOKE(root) if root is not None else []
+
+    if not box:
+        raise ValueError("joke not found")
+
+    return [str(box[0].text_content())]
+
+
+def yt_results(html, limit=10):
+    '''
+    Returns:
+        array[tuple(href, title)]: First *limit* results links in a YouTube
+                                    search page.
+    '''
+    root = document(html)
+
+    if root is None:
+        return []
+
+    return [(link.get('href'), link.get('title')) for link in YT_RESULTS(root)[:limit]]
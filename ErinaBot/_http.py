@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+"""
+The MIT License (MIT)
+
+Copyright (c) 2020 edo0xff
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+import asyncio
+import aiohttp
+
+
+class HTTPClient():
+    '''
+    Asynchronous HTTP client shared by the scrapers (see *ErinaBot.utils*) and
+    the music player. Connections are kept alive and reused, there is a limit
+    of connections per host, every request has a timeout and failed requests
+    (connection errors, timeouts, 429 and 5xx responses) are retried with an
+    exponential backoff.
+
+    The aiohttp session is created on the first request, inside the running
+    event loop.
+
+    .. code-block:: python
+
+        html = await erina.http.get_text("https://example.com")
+    '''
+    def __init__(self, limit=100, limit_per_host=8, timeout=10.0, retries=2, backoff=0.5,
+                    headers=None):
+        '''
+        Args:
+            limit(int): Max open connections.
+            limit_per_host(int): Max open connections to the same host.
+            timeout(float): Seconds a request can take.
+            retries(int): Times a failed request is tried again.
+            backoff(float): Seconds before the first retry, it doubles on
+                            every retry.
+            headers(dict): Headers sent with every request.
+        '''
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.headers = headers
+
+        self._session = None
+
+        self.requests = 0
+        self.retried = 0
+        self.failures = 0
+
+    @property
+    def session(self):
+        '''
+        aiohttp.ClientSession: Created on first use.
+        '''
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host,
+                                                ttl_dns_cache=300)
+
+            self._session = aiohttp.ClientSession(connector=connector, headers=self.headers,
+                                timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+        return self._session
+
+    async def get_text(self, url, params=None):
+        '''
+        Makes a GET request.
+
+        Args:
+            url(str): Request url.
+            params(dict): Query string parameters.
+
+        Returns:
+            str: Response body.
+
+        Raises:
+            aiohttp.ClientError, asyncio.TimeoutError: If the request keeps
+                                                        failing after retrying.
+        '''
+        for attempt in range(self.retries + 1):
+            self.requests += 1
+
+            try:
+                async with self.session.get(url, params=params) as response:
+                    if response.status == 429 or response.status >= 500:
+                        response.raise_for_status()
+
+                    return await response.text()
+
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                if attempt == self.retries:
+                    self.failures += 1
+                    raise
+
+            self.retried += 1
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def close(self):
+        '''
+        Closes the connections.
+        '''
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+        self._session = None
+
+    def stats(self):
+        '''
+        Client statistics.
+
+        Returns:
+            dict: *requests* made (retries included), *retried* and *failures*.
+        '''
+        return {
+            'requests': self.requests,
+            'retried': self.retried,
+            'failures': self.failures,
+        }
+
+
+#: Client used when none is given.
+shared = HTTPClient()
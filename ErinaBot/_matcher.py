@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+
+"""
+The MIT License (MIT)
+
+Copyright (c) 2020 edo0xff
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+import numpy
+import Levenshtein
+
+#: Bytes the :func:`distance_matrix` tables can use at once.
+DISTANCE_MEMORY = 64 * 1024 ** 2
+
+# int32 tables per (text, phrase, column) cell, numpy temporaries included
+_DISTANCE_TABLES = 8
+
+
+class LinearMatcher():
+    '''
+    Reference matcher, it compares the input string against every indexed
+    phrase. It is the behaviour the bot always had and it is useful to check
+    the results of the other matchers.
+
+    All the matchers share the same interface: phrases are added with
+    :meth:`add` and :meth:`nearest` returns the position of the closest
+    phrase and its levenshtein distance. When two phrases are at the same
+    distance the one added first wins.
+    '''
+    def __init__(self):
+        self.phrases = []
+
+    def __len__(self):
+        return len(self.phrases)
+
+    def add(self, phrase, index):
+        '''
+        Adds a phrase to the matcher.
+
+        Args:
+            phrase(str): Cleaned phrase.
+            index(int): Position of the phrase in the conversation dictionary.
+        '''
+        self.phrases.append((phrase, index))
+
+    def nearest(self, text, max_distance=None):
+        '''
+        Search for the closest phrase to the given string.
+
+        Args:
+            text(str): Cleaned string.
+            max_distance(int): Ignore phrases farther than this.
+
+        Returns:
+            tuple(index, distance): Dictionary position of the closest phrase
+                                    and its distance (None, None if there is
+                                    no phrase close enough).
+        '''
+        best_index = None
+        best_distance = max_distance
+
+        for phrase, index in self.phrases:
+            distance = Levenshtein.distance(phrase, text)
+
+            if best_distance is None or distance < best_distance\
+                or (distance == best_distance and best_index is None):
+                best_distance = distance
+                best_index = index
+
+                if distance == 0:
+                    break
+
+        if best_index is None:
+            return None, None
+
+        return best_index, best_distance
+
+
+class _BKNode():
+    '''
+    BK-tree node. Repeated phrases share the node, only the first index
+    is kept because it is the one that wins ties.
+    '''
+    __slots__ = ('phrase', 'index', 'children')
+
+    def __init__(self, phrase, index):
+        self.phrase = phrase
+        self.index = index
+        self.children = {}
+
+
+class BKTreeMatcher():
+    '''
+    Matcher backed by a `BK-tree <https://en.wikipedia.org/wiki/BK-tree>`_.
+    Levenshtein distance is a metric so the triangle inequality lets us skip
+    whole subtrees that can't contain a phrase closer than the best one found
+    so far. The search stops as soon as an exact match is found.
+
+    It returns exactly the same phrase as :class:`LinearMatcher`.
+    '''
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, phrase, index):
+        '''
+        Adds a phrase to the tree.
+
+        Args:
+            phrase(str): Cleaned phrase.
+            index(int): Position of the phrase in the conversation dictionary.
+        '''
+        self.size += 1
+
+        if self.root is None:
+            self.root = _BKNode(phrase, index)
+            return
+
+        node = self.root
+
+        while True:
+            distance = Levenshtein.distance(phrase, node.phrase)
+
+            if distance == 0:
+                node.index = min(node.index, index)
+                return
+
+            child = node.children.get(distance)
+
+            if child is None:
+                node.children[distance] = _BKNode(phrase, index)
+                return
+
+            node = child
+
+    def nearest(self, text, max_distance=None):
+        '''
+        Search for the closest phrase to the given string.
+
+        Args:
+            text(str): Cleaned string.
+            max_distance(int): Ignore phrases farther than this.
+
+        Returns:
+            tuple(index, distance): Dictionary position of the closest phrase
+                                    and its distance (None, None if there is
+                                    no phrase close enough).
+        '''
+        if self.root is None:
+            return None, None
+
+        best_index = None
+        best_distance = max_distance
+        pending = [(self.root, 0)]
+
+        while pending:
+            node, lower_bound = pending.pop()
+
+            if best_distance is not None and lower_bound > best_distance:
+                continue
+
+            distance = Levenshtein.distance(text, node.phrase)
+
+            if best_distance is None or distance < best_distance\
+                or (distance == best_distance
+                    and (best_index is None or node.index < best_index)):
+                best_distance = distance
+                best_index = node.index
+
+                if distance == 0:
+                    break
+
+            # ties must be visited too, a phrase at the same distance
+            # could have been loaded before the current best one
+            for edge, child in node.children.items():
+                lower_bound = abs(edge - distance)
+
+                if best_distance is None or lower_bound <= best_distance:
+                    pending.append((child, lower_bound))
+
+        if best_index is None:
+            return None, None
+
+        return best_index, best_distance
+
+
+def _encode(strings):
+    '''
+    Encodes strings as a zero padded matrix of unicode code points.
+    '''
+    lengths = numpy.array([len(s) for s in strings], dtype=numpy.int32)
+    matrix = numpy.zeros((len(strings), max(lengths.max(initial=0), 1)), dtype=numpy.int32)
+
+    for i, s in enumerate(strings):
+        matrix[i, :len(s)] = [ord(c) for c in s]
+
+    return matrix, lengths
+
+
+def distance_matrix(texts, phrases, chunk_size=None, memory=DISTANCE_MEMORY):
+    '''
+    Computes the levenshtein distance between every text and every phrase.
+
+    The dynamic programming table is filled for all the (text, phrase) pairs
+    at the same time, so the python loops only depend on the strings length
+    and not on how many strings there are.
+
+    Args:
+        texts(list[str]): Cleaned strings.
+        phrases(list[str]): Cleaned dictionary phrases.
+        chunk_size(int): Texts processed at once, by default as many as fit
+                            in *memory*.
+        memory(int): Bytes the tables can use, each text in a chunk needs
+                        about 32 * len(phrases) * longest phrase.
+
+    Returns:
+        numpy.ndarray: Matrix of shape (len(texts), len(phrases)).
+    '''
+    result = numpy.zeros((len(texts), len(phrases)), dtype=numpy.int32)
+
+    if not len(texts) or not len(phrases):
+        return result
+
+    phrase_codes, phrase_lengths = _encode(phrases)
+    columns = phrase_codes.shape[1]
+
+    if chunk_size is None:
+        row_size = len(phrases) * (columns + 1) * 4 * _DISTANCE_TABLES
+        chunk_size = max(memory // row_size, 1)
+
+    for start in range(0, len(texts), chunk_size):
+        chunk = texts[start:start + chunk_size]
+        text_codes, text_lengths = _encode(chunk)
+        distances = result[start:start + len(chunk)]
+
+        # empty texts are just as far as the phrase length
+        distances[text_lengths == 0] = phrase_lengths
+
+        previous = numpy.empty((len(chunk), len(phrases), columns + 1), dtype=numpy.int32)
+        previous[:] = numpy.arange(columns + 1, dtype=numpy.int32)
+        current = numpy.empty_like(previous)
+
+        for i in range(1, text_lengths.max() + 1):
+            # cells past the phrase length are garbage but they are never
+            # read, the distance is taken at the phrase length column
+            chars = text_codes[:, i - 1, None, None]
+            cost = (chars != phrase_codes[None, :, :]).astype(numpy.int32)
+
+            replaced = numpy.minimum(previous[:, :, 1:] + 1, previous[:, :, :-1] + cost)
+
+            current[:, :, 0] = i
+            for j in range(1, columns + 1):
+                numpy.minimum(replaced[:, :, j - 1], current[:, :, j - 1] + 1,
+                                out=current[:, :, j])
+
+            finished = text_lengths == i
+            if finished.any():
+                rows = current[finished]
+                distances[finished] = numpy.take_along_axis(
+                    rows, phrase_lengths[None, :, None], axis=2)[:, :, 0]
+
+            previous, current = current, previous
+
+    return result
+
+
+#: Available matcher backends, see :meth:`ErinaBot.Conversation.__init__`.
+matchers = {
+    'linear': LinearMatcher,
+    'bktree': BKTreeMatcher,
+}
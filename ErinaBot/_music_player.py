@@ -26,6 +26,7 @@ DEALINGS IN THE SOFTWARE.
 
 import os
 import re
+import uuid
 import hashlib
 import discord
 import asyncio
@@ -34,8 +35,33 @@ import unidecode
 import youtube_dl
 
 from requests import get
-from bs4 import BeautifulSoup
 from async_timeout import timeout
+from concurrent.futures import ThreadPoolExecutor
+
+from ._normalizer import YT_URL
+from ._audio import ffmpeg_stats, RECORD_OPTIONS, create_audio_source
+from ._song_cache import SongCache, MetadataStore, convert_to_opus
+from ._voice_workers import VoiceWorkerPool, WorkerAudioSource
+from ._http import shared
+from . import _extract
+
+
+def yt_video_id(url):
+    '''
+    Gets the video id of a YouTube url.
+
+    Args:
+        url(str): YouTube url.
+
+    Returns:
+        str: Video id (None if it isn't a video url).
+    '''
+    regex = YT_URL.search(url)
+
+    if not regex:
+        return None
+
+    return regex.group(6)
 
 
 class MusicQueue():
@@ -54,8 +80,12 @@ class MusicQueue():
 
     .. attribute:: volume(float)
         Volume for the queue songs (float from 0.0 to 1.0, 1.0 by default)
+
+    .. attribute:: prefetch_count(int)
+        Pending songs (see :meth:`MusicPlayer.enqueue`) downloaded in background
+        while the current one plays.
     '''
-    def __init__(self, text_channel, voice_channel, loop):
+    def __init__(self, text_channel, voice_channel, loop, player, prefetch=2):
         '''
         Initializes the Music Queue.
 
@@ -66,24 +96,86 @@ class MusicQueue():
             voice_channel(discord.VoiceClient): Songs will be played here.
             loop(asyncio.AbstractEventLoop): We need this to create tasks (we get
                                                 it from client.loop).
+            player(ErinaBot.MusicPlayer): Player that downloads pending songs
+                                            and creates audio sources.
+            prefetch(int): Pending songs downloaded ahead.
         '''
         self.queue = asyncio.Queue(maxsize=50)
         self.next = asyncio.Event()
         self.text_channel = text_channel
         self.voice_channel = voice_channel
         self.loop = loop
+        self.player = player
+        self.prefetch_count = prefetch
         self.task = self.loop.create_task(self.__queue_worker())
         self.active = True
         self.volume = 1.0
 
+    def put(self, song):
+        '''
+        Adds a song to the queue. Its file is pinned in the cache (see
+        :meth:`MusicPlayer.pin_song`) until the song is played or the queue
+        is destroyed.
+
+        Args:
+            song(dict): Queued song (['metadata'] and ['task']).
+        '''
+        self.queue.put_nowait(song)
+        song['pinned'] = self.player.pin_song(song['metadata'])
+
+    def prefetch(self):
+        '''
+        Starts downloading the next *prefetch_count* pending songs in the queue
+        (if they are not being downloaded already).
+        '''
+        for song in itertools.islice(self.queue._queue, 0, self.prefetch_count):
+            self.__resolve(song)
+
+    def __resolve(self, song):
+        '''
+        Gets the task that resolves (downloads) a pending song, it creates the
+        task if it doesn't exist.
+        '''
+        if song.get('task') is None and song['metadata']['path'] is None:
+            song['task'] = self.loop.create_task(
+                self.player.resolve_song(song['metadata'], song.get('on_resolved')))
+
+        return song.get('task')
+
+    async def __create_source(self, song):
+        '''
+        Creates the audio source for a song right before it plays, so queued
+        songs don't keep an idle FFmpeg process. Pending songs are resolved
+        first (see :meth:`MusicPlayer.resolve_song`): cached songs are played
+        from the cache and, if the player can stream, the other ones are
+        played from a stream instead of waiting for the download.
+
+        Returns:
+            discord.AudioSource: None if the song couldn't be resolved.
+        '''
+        task = self.__resolve(song)
+
+        if task and not await task:
+            return None
+
+        return self.player.create_source(song['metadata'], self.volume)
+
     async def __destroy(self):
         '''
         Disconnects voice channel and stops task loop.
         '''
         await self.voice_channel.disconnect()
         self.active = False
+
+        while not self.queue.empty():
+            self.__unpin(self.queue.get_nowait())
+
         self.task.cancel()
 
+    def __unpin(self, song):
+        if song.get('pinned'):
+            self.player.cache.unpin(song.pop('pinned'))
+
     async def __queue_worker(self):
         '''
         Queue worker waits for songs in the queue and plays them in voice channel.
@@ -106,13 +198,37 @@ class MusicQueue():
                 await self.__destroy()
                 continue
 
-            if not self.voice_channel.is_connected():
-                await self.__destroy()
-                continue
+            try:
+                if not self.voice_channel.is_connected():
+                    await self.__destroy()
+                    continue
+
+                await self.__play(song)
+
+            except asyncio.CancelledError:
+                raise
+
+            except Exception as e:
+                # a bad song is skipped, the queue keeps playing
+                print("MusicQueueError: couldn't play '%s': %s" %(song['metadata']['url'], e))
 
-            source = song['source']
-            metadata = song['metadata']
+            finally:
+                self.__unpin(song)
 
+    async def __play(self, song):
+        '''
+        Plays a song and waits until it ends.
+        '''
+        self.prefetch()
+
+        metadata = song['metadata']
+        source = await self.__create_source(song)
+
+        if source is None:
+            await self.text_channel.send("Lo siento no pude descargar **%s** :C" %(metadata['title']))
+            return
+
+        try:
             embed = (discord.Embed(title=":headphones: Ahora suena", description=metadata["title"], color=discord.Color.purple())
                     .set_thumbnail(url=metadata['thumbnail'])
                     .add_field(name="Requested By", value=metadata['requested_by'])
@@ -120,14 +236,15 @@ class MusicQueue():
 
             await self.text_channel.send(embed=embed)
 
-            source.volume = self.volume
-
             self.voice_channel.play(source, after=lambda _: self.loop.call_soon_threadsafe(self.next.set))
             self.voice_channel.is_playing()
 
             await self.next.wait()
 
-            source.cleanup()
+        finally:
+            # it can wait for FFmpeg to finish a recording
+            await self.loop.run_in_executor(None, source.cleanup)
+            await self.player.finish_recording_async(metadata, source, song.get('on_resolved'))
 
 
 class MusicPlayer():
@@ -137,9 +254,52 @@ class MusicPlayer():
 
     .. attribute:: queues(dict)
         Dictionary that contains *channel* -> *music queue*.
+
+    .. attribute:: executor(concurrent.futures.ThreadPoolExecutor)
+        Pool where searches and downloads run (see the *_async* methods).
+
+    .. attribute:: cache(ErinaBot._song_cache.SongCache)
+        Downloaded songs, stored by YouTube video id.
+
+    .. attribute:: metadata(ErinaBot._song_cache.MetadataStore)
+        Known videos metadata, by YouTube video id.
+
+    .. attribute:: workers(ErinaBot._voice_workers.VoiceWorkerPool)
+        Voice worker processes, None if songs are played in the bot process.
     '''
-    def __init__(self):
+    def __init__(self, max_workers=4, songs_dir="songs/", max_cache_size=5 * 1024 ** 3,
+                    stream=True, prefetch=2, audio_format="mp3", voice_workers=0, http=None):
+        '''
+        Args:
+            max_workers(int): Max searches and downloads running at once.
+            songs_dir(str): Directory where songs are downloaded.
+            max_cache_size(int): Bytes the downloaded songs can use, least
+                                    recently played songs are removed.
+            stream(bool): Play songs that are not cached yet while they are
+                            downloaded (see :meth:`stream_yt_video_async`).
+            prefetch(int): Queued songs downloaded ahead (see :meth:`enqueue`).
+            audio_format(str): Downloaded songs format, *mp3* or *opus*. Opus
+                                songs are played without transcoding (see
+                                :meth:`create_source`), use
+                                :meth:`convert_songs_to_opus` to convert the
+                                songs already downloaded.
+            voice_workers(int): Processes that decode and encode the songs
+                                being played (see
+                                :class:`ErinaBot._voice_workers.VoiceWorkerPool`),
+                                0 to do it in the bot process.
+            http(ErinaBot._http.HTTPClient): Client for the searches, the
+                                                shared one by default.
+        '''
         self.queues = {}
+        self.audio_format = audio_format
+        self.cache = SongCache(songs_dir, max_cache_size, audio_format)
+        self.metadata = MetadataStore(os.path.join(songs_dir, "metadata.json"))
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.running = {}
+        self.stream = stream
+        self.prefetch = prefetch
+        self.workers = VoiceWorkerPool(voice_workers) if voice_workers else None
+        self.http = http or shared
 
     async def get_voice_channel(self, client, author):
         '''
@@ -183,7 +343,7 @@ class MusicPlayer():
             queue = self.queues[voice_channel.guild.id]
 
         if not queue or not queue.active:
-            queue = MusicQueue(text_channel, voice_channel, loop)
+            queue = MusicQueue(text_channel, voice_channel, loop, self, self.prefetch)
             self.queues[voice_channel.guild.id] = queue
 
         return queue
@@ -201,6 +361,7 @@ class MusicPlayer():
     def set_volume(self, voice_channel, volume):
         '''
         Sets the music volume for the given channel (if it is playing music).
+        Opus songs keep their volume until the next song starts.
 
         Args:
             voice_channel(discord.VoiceClient): Set the volumen for this channel.
@@ -213,7 +374,10 @@ class MusicPlayer():
             return
 
         queue.volume = volume
-        voice_channel.source.volume = volume
+
+        # opus sources get the new volume from the next song
+        if isinstance(voice_channel.source, (discord.PCMVolumeTransformer, WorkerAudioSource)):
+            voice_channel.source.volume = volume
 
     def get_queue_info(self, voice_channel):
         '''
@@ -223,7 +387,7 @@ class MusicPlayer():
             voice_channel(discord.VoiceClient): Gets the queued songs of this channel.
 
         Returns:
-            array[dict]: Array of dictionaries (each dictionary contains: ['source'] and ['metadata'] keys).
+            array[dict]: Array of dictionaries (each dictionary contains a ['metadata'] key).
         '''
         if voice_channel.guild.id in self.queues.keys():
             queue = self.queues[voice_channel.guild.id]
@@ -252,18 +416,141 @@ class MusicPlayer():
         '''
         response = get("https://www.youtube.com/results?search_query=%s" %(query))
 
-        soup = BeautifulSoup(response.text, 'lxml')
+        return self.parse_yt_search(response.text)
 
+    def parse_yt_search(self, html):
+        '''
+        Gets the videos in a YouTube search results page.
+
+        Args:
+            html(str): Search results page.
+
+        Returns:
+            array[dict]: Same as :meth:`search_yt_video`.
+        '''
         videos = []
-        for vid in soup.find_all(attrs={'class':'yt-uix-tile-link'}, limit=10):
-            url = 'https://www.youtube.com' + vid['href']
-            name = vid['title']
+        for href, name in _extract.yt_results(html, limit=10):
+            if href is None:
+                continue
+
+            url = 'https://www.youtube.com' + href
 
             if not "user" in url and not "channel" in url and not "playlist" in url:
                 videos.append({'url':url, 'name':name})
 
         return videos
 
+    async def search_yt_video_async(self, query):
+        '''
+        Same as :meth:`search_yt_video` but the page is downloaded with the
+        player HTTP client (*http*) and parsed in the player executor, so it
+        doesn't block the event loop. Concurrent searches of the same query
+        are made only once.
+
+        Args:
+            query(str): Search for videos of this in YouTube.
+
+        Returns:
+            array[dict]: Array dictionaries of the results (each dictionary contains ['url'] and ['name'] keys)
+        '''
+        return await self.__coalesce(('search', query), self.__search_yt_video, query)
+
+    async def __search_yt_video(self, query):
+        html = await self.http.get_text("https://www.youtube.com/results",
+                                        params={'search_query': query})
+
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, self.parse_yt_search, html)
+
+    async def download_yt_video_async(self, url):
+        '''
+        Same as :meth:`download_yt_video` but it runs in the player executor
+        so it doesn't block the event loop. If the same video is already being
+        downloaded (by example two guilds asked for the same song) it waits
+        for that download instead of starting another one.
+
+        Args:
+            url(str): Url for the video to download.
+
+        Returns:
+            tuple(song_path, song_title, song_thumbnail): each value will be False if the download fails.
+        '''
+        key = ('download', yt_video_id(url) or url)
+        return await self.__coalesce(key, self.download_yt_video, url)
+
+    def stream_yt_video(self, url):
+        '''
+        Gets the direct audio stream of a YouTube video so it can be played
+        before it is downloaded. Cached songs are not extracted, they don't
+        need a stream.
+
+        Args:
+            url(str): Url for the video to stream.
+
+        Returns:
+            tuple(song_path, song_title, song_thumbnail, stream_url): song_path is
+                where the cached copy is (or will be), stream_url is None if the
+                song is cached. Each value will be False if the extraction fails.
+        '''
+        if "user" in url or "channel" in url or "playlist" in url:
+            return False, False, False, False
+
+        video_id = yt_video_id(url)
+
+        if not video_id:
+            return False, False, False, False
+
+        song = self.cache.get(video_id)
+
+        if song:
+            return song['path'], song['title'], song['thumbnail'], None
+
+        with youtube_dl.YoutubeDL({'format': 'bestaudio/best', 'noplaylist': True}) as ydl:
+            info = ydl.extract_info(url, download=False)
+
+        metadata = self.metadata.add(info)
+
+        if not info.get('url'):
+            return False, False, False, False
+
+        return self.cache.path_for(video_id), metadata['title'], metadata['thumbnail'], info['url']
+
+    async def stream_yt_video_async(self, url):
+        '''
+        Same as :meth:`stream_yt_video` but it runs in the player executor.
+        Streamed songs are saved to the cache while they play (see
+        :meth:`create_source`), they are not downloaded again.
+
+        Args:
+            url(str): Url for the video to stream.
+
+        Returns:
+            tuple(song_path, song_title, song_thumbnail, stream_url): each value will be False if the extraction fails.
+        '''
+        key = ('stream', yt_video_id(url) or url)
+        return await self.__coalesce(key, self.stream_yt_video, url)
+
+    async def __coalesce(self, key, func, *args):
+        '''
+        Runs *func* in the executor (or as a task if it is a coroutine
+        function) unless there is already a call running for *key*, in that
+        case it waits for its result.
+        '''
+        future = self.running.get(key)
+
+        if future is None:
+            if asyncio.iscoroutinefunction(func):
+                future = asyncio.ensure_future(func(*args))
+
+            else:
+                future = asyncio.get_event_loop().run_in_executor(self.executor, func, *args)
+
+            future.add_done_callback(lambda _: self.running.pop(key, None))
+            self.running[key] = future
+
+        # a cancelled waiter must not cancel the other ones
+        return await asyncio.shield(future)
+
     def download_yt_video(self, url):
         '''
         Downloads a YouTube video.
@@ -277,46 +564,97 @@ class MusicPlayer():
         if "user" in url or "channel" in url or "playlist" in url:
             return False, False, False
 
-        response = get(url)
-        soup = BeautifulSoup(response.text, 'lxml')
-        song_title = soup.find("meta", attrs={'property':'og:title'})['content']
-        song_thumbnail = soup.find("meta", attrs={'property':'og:image'})['content']
+        video_id = yt_video_id(url)
 
-        song_path = "songs/%s.mp3" %(song_title)
+        if not video_id:
+            return False, False, False
 
-        if not os.path.exists(song_path):
-            ydl_opts = {
-                'format': 'bestaudio/best',
-                'postprocessors': [{
-                    'key': 'FFmpegExtractAudio',
-                    'preferredcodec': 'mp3',
-                    'preferredquality': '192',
-                }],
-                'outtmpl': 'songs/' + song_title + '.%(ext)s'
-            }
+        song = self.cache.get(video_id)
+
+        if song:
+            return song['path'], song['title'], song['thumbnail']
 
-            with youtube_dl.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
+        song_path = self.cache.path_for(video_id)
+
+        ydl_opts = {
+            'format': 'bestaudio/best',
+            'noplaylist': True,
+            'postprocessors': [{
+                'key': 'FFmpegExtractAudio',
+                'preferredcodec': self.audio_format,
+                'preferredquality': '192' if self.audio_format == 'mp3' else '128',
+            }],
+            'outtmpl': os.path.splitext(song_path)[0] + '.%(ext)s'
+        }
+
+        # one extraction gives the song metadata and downloads it
+        with youtube_dl.YoutubeDL(ydl_opts) as ydl:
+            info = ydl.extract_info(url, download=True)
+
+        metadata = self.metadata.add(info)
 
         if not os.path.exists(song_path):
             return False, False, False
 
-        return song_path, song_title, song_thumbnail
+        self.cache.add(video_id, metadata['title'], metadata['thumbnail'], metadata['duration'])
+
+        return song_path, metadata['title'], metadata['thumbnail']
 
-    def list_downloaded_songs(self):
+    def list_downloaded_songs(self, page=0, page_size=25):
         '''
-        Get a list of the downloaded songs.
+        Get a page of the downloaded songs, sorted by title. Songs are listed
+        from the cache index, the songs directory is not scanned.
+
+        Args:
+            page(int): Page number, from 0.
+            page_size(int): Songs per page.
+
+        Returns:
+            tuple(songs, pages): Downloaded songs (each dictionary contains
+                                    ['key'], ['path'], ['title'], ['thumbnail'],
+                                    ['duration'] and ['play_count'] keys) and
+                                    the number of pages.
+        '''
+        return self.cache.page(page, page_size)
+
+    def search_downloaded_songs(self, query, limit=10):
+        '''
+        Looks for downloaded songs by title (see :meth:`ErinaBot._song_cache.SongCache.search`).
+
+        Args:
+            query(str): Song title, or part of it.
+            limit(int): Max songs returned.
 
         Returns:
-            array[str]: Names of the donwloaded songs (only name not full path).
+            array[dict]: Downloaded songs, best matches first.
+        '''
+        return self.cache.search(query, limit)
+
+    def get_downloaded_song(self, key, requested_by=None):
         '''
-        entries = os.scandir("songs/")
-        songs = []
-        for entry in entries:
-            if entry.is_file():
-                songs.append(entry.name)
+        Gets the metadata to play a downloaded song (see :meth:`play`).
+
+        Args:
+            key(str): Song key (from :meth:`list_downloaded_songs`).
+            requested_by(str): Who is asking for the song.
 
-        return songs
+        Returns:
+            dict: Song metadata or None if the song is not downloaded anymore.
+        '''
+        song = self.cache.find(key)
+
+        if not song or not os.path.exists(song['path']):
+            return None
+
+        video = self.metadata.get(song['id']) if song['id'] else None
+
+        return {
+            'path': song['path'],
+            'title': song['title'],
+            'thumbnail': song['thumbnail'],
+            'url': video['url'] if video else "",
+            'requested_by': requested_by
+        }
 
     def play(self, client, ctx, voice_channel, metadata):
         '''
@@ -337,6 +675,12 @@ class MusicPlayer():
         .. note::
             You get those parameters (path, title, thumbnail) from ErinaBot.download_yt_video()
 
+        Songs that are not downloaded yet can be played from a stream (any
+        url FFmpeg can read, see :meth:`stream_yt_video_async`) adding
+        *'stream_url'* to the metadata. The stream is only used if the song
+        in *'path'* is not in the cache, the file could be a download that
+        didn't finish.
+
         Args:
             client(discord.Client): Needed to create the queue if it doesn't exists.
             ctx(discord.Message): Needed to create the queue if it doesn't exists.
@@ -345,12 +689,260 @@ class MusicPlayer():
         '''
         queue = self.get_queue(ctx.channel, voice_channel, client.loop)
 
-        source = discord.FFmpegPCMAudio(metadata['path'])
-        source = discord.PCMVolumeTransformer(source)
-
         song = {
-            "source": source,
+            "task": None,
             "metadata": metadata
         }
 
-        queue.queue.put_nowait(song)
+        queue.put(song)
+
+    def enqueue(self, client, ctx, voice_channel, url, title=None, on_resolved=None):
+        '''
+        Enqueue a YouTube video without downloading it, it returns immediately.
+        The queue downloads the next songs in background while the current one
+        plays (see *prefetch*), so songs start without waiting.
+
+        Args:
+            client(discord.Client): Needed to create the queue if it doesn't exists.
+            ctx(discord.Message): Needed to create the queue if it doesn't exists.
+            voice_channel(discord.VoiceClient): The song will be played here.
+            url(str): YouTube video url.
+            title(str): Title to show in the queue until the song is downloaded.
+            on_resolved(callable): Called with the song metadata once it is
+                                    downloaded (by example to save it).
+        '''
+        queue = self.get_queue(ctx.channel, voice_channel, client.loop)
+
+        if not title:
+            video_id = yt_video_id(url)
+            known = self.metadata.get(video_id) if video_id else None
+            title = known['title'] if known else url
+
+        song = {
+            "task": None,
+            "on_resolved": on_resolved,
+            "metadata": {
+                'path': None,
+                'title': title,
+                'thumbnail': None,
+                'url': url,
+                'requested_by': ctx.author.mention
+            }
+        }
+
+        queue.put(song)
+        queue.prefetch()
+
+    def pin_song(self, metadata):
+        '''
+        Pins the file of a queued song in the cache so it isn't evicted while
+        it waits to be played (see :meth:`ErinaBot._song_cache.SongCache.pin`).
+        Pending songs are pinned by the path they will be downloaded to.
+
+        Args:
+            metadata(dict): Song metadata.
+
+        Returns:
+            str: Pinned path, None if the song doesn't have one.
+        '''
+        path = metadata['path']
+
+        if not path:
+            video_id = yt_video_id(metadata.get('url') or "")
+            path = self.cache.path_for(video_id) if video_id else None
+
+        if path:
+            self.cache.pin(path)
+
+        return path
+
+    async def resolve_song(self, metadata, on_resolved=None):
+        '''
+        Fills the metadata of a pending song. Cached songs are resolved
+        without any network call. The other ones are downloaded or, if the
+        player can *stream*, only extracted (*'stream_url'* is added to the
+        metadata), they are saved to the cache while they play.
+
+        Args:
+            metadata(dict): Pending song metadata (see :meth:`enqueue`).
+            on_resolved(callable): Called with the song metadata once it is
+                                    downloaded, it can be a coroutine function.
+                                    Streamed songs call it from
+                                    :meth:`finish_recording_async`.
+
+        Returns:
+            boolean: False if the download (or the extraction) fails.
+        '''
+        stream_url = None
+
+        try:
+            if self.stream:
+                song_path, song_title, song_thumbnail, stream_url = \
+                    await self.stream_yt_video_async(metadata['url'])
+
+            else:
+                song_path, song_title, song_thumbnail = \
+                    await self.download_yt_video_async(metadata['url'])
+
+        except Exception as e:
+            print("MusicPlayerError: couldn't download '%s': %s" %(metadata['url'], e))
+            return False
+
+        if not song_path:
+            return False
+
+        metadata.update({
+            'path': song_path,
+            'title': song_title,
+            'thumbnail': song_thumbnail
+        })
+
+        if stream_url:
+            metadata['stream_url'] = stream_url
+            return True
+
+        await self.__resolved(metadata, on_resolved)
+        return True
+
+    async def __resolved(self, metadata, on_resolved):
+        if on_resolved:
+            result = on_resolved({key: metadata[key] for key in
+                                    ('path', 'title', 'thumbnail', 'url', 'requested_by')})
+
+            if asyncio.iscoroutine(result):
+                await result
+
+    def convert_songs_to_opus(self, bitrate="128k", on_converted=None):
+        '''
+        Converts the downloaded songs to Ogg/Opus (see *migrate_songs.py*),
+        new downloads are stored as Opus too.
+
+        Args:
+            bitrate(str): Opus bitrate.
+            on_converted(callable): Called with the old and the new path of
+                                    each converted song.
+
+        Returns:
+            tuple(converted, failed): How many songs were converted or failed.
+        '''
+        self.audio_format = "opus"
+        self.cache.extension = "opus"
+
+        return convert_to_opus(self.cache, bitrate, on_converted)
+
+    def stats(self):
+        '''
+        Player statistics.
+
+        Returns:
+            dict: *queues*, *queued_songs*, *ffmpeg_processes* (running right now),
+                    *ffmpeg_spawned* and *voice_workers* (pool stats or None).
+        '''
+        queues = [queue for queue in self.queues.values() if queue.active]
+
+        return {
+            'queues': len(queues),
+            'queued_songs': sum(queue.queue.qsize() for queue in queues),
+            'ffmpeg_processes': ffmpeg_stats.live,
+            'ffmpeg_spawned': ffmpeg_stats.spawned,
+            'voice_workers': self.workers.stats() if self.workers else None,
+        }
+
+    def create_source(self, metadata, volume=1.0):
+        '''
+        Creates the audio source for a song (see :func:`create_audio_source`).
+        If the player has *voice_workers* the song is decoded and encoded in
+        a worker process.
+
+        Args:
+            metadata(dict): Song metadata (see :meth:`play`).
+            volume(float): Volume from 0.0 to 1.0.
+
+        Songs are played from their file only if it is in the cache, a file
+        that is not there yet could be a download that didn't finish. Streams
+        are recorded to a temporary file while they play, see
+        :meth:`finish_recording`.
+
+        Returns:
+            discord.AudioSource: Audio source.
+        '''
+        path = metadata['path']
+
+        if path and self.cache.find(path=path):
+            metadata.pop('stream_url', None)
+            self.cache.played(path)
+
+        elif path and metadata.get('stream_url') and os.path.splitext(path)[1] in RECORD_OPTIONS:
+            # unique, two guilds can be streaming the same song
+            metadata['record'] = "%s.%s.part" %(os.path.splitext(path)[0], uuid.uuid4().hex[:8])
+
+        if self.workers:
+            return self.workers.create_source(metadata, volume)
+
+        return create_audio_source(metadata, volume)
+
+    def finish_recording(self, metadata, source):
+        '''
+        Adds a song recorded while it was streamed (see :meth:`create_source`)
+        to the cache if it was played until the end, otherwise the recording
+        is removed. Call it once the source is cleaned up.
+
+        Args:
+            metadata(dict): Song metadata.
+            source(discord.AudioSource): The song audio source.
+
+        Returns:
+            boolean: True if the song was added to the cache.
+        '''
+        record = metadata.pop('record', None)
+
+        if not record:
+            return False
+
+        video_id = yt_video_id(metadata.get('url') or "")
+        recorded = getattr(getattr(source, 'original', source), 'recorded', False)
+
+        try:
+            if not recorded or not video_id or not os.path.getsize(record):
+                return False
+
+            os.replace(record, metadata['path'])
+
+        except OSError:
+            return False
+
+        finally:
+            if os.path.exists(record):
+                os.remove(record)
+
+        video = self.metadata.get(video_id) or {}
+        self.cache.add(video_id, metadata['title'], metadata['thumbnail'], video.get('duration'))
+        self.cache.played(metadata['path'])
+        metadata.pop('stream_url', None)
+
+        return True
+
+    async def finish_recording_async(self, metadata, source, on_resolved=None):
+        '''
+        Same as :meth:`finish_recording` but it runs in the player executor.
+
+        Args:
+            on_resolved(callable): Called with the song metadata if the song
+                                    was added to the cache (see :meth:`resolve_song`).
+
+        Returns:
+            boolean: True if the song was added to the cache.
+        '''
+        try:
+            loop = asyncio.get_event_loop()
+
+            if not await loop.run_in_executor(self.executor, self.finish_recording, metadata, source):
+                return False
+
+            await self.__resolved(metadata, on_resolved)
+
+        except Exception as e:
+            print("MusicPlayerError: couldn't save the recording of '%s': %s" %(metadata.get('url'), e))
+            return False
+
+        return True
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+
+"""
+The MIT License (MIT)
+
+Copyright (c) 2020 edo0xff
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+import re
+import string
+import unidecode
+
+from functools import lru_cache
+
+#: Quoted strings and numbers, both are arguments not part of the phrase.
+ARGUMENTS = re.compile(r'(\"|\')(.+)(\"|\')|[0-9]+')
+
+#: Bot's name (eri).
+BOT_NAME = re.compile(r'(^e+r+i+\s+)|(\s+e+r+i+$)|(\s+e+r+i+\s+)')
+
+#: YouTube video url.
+YT_URL = re.compile(
+    r'(https?://)?(www\.)?'
+    r'(youtube|youtu|youtube-nocookie)\.(com|be)/'
+    r'(watch\?v=|embed/|v/|.+\?v=)?([^&=%\?]{11})')
+
+#: str.translate table that removes punctuation characters.
+PUNCTUATION = str.maketrans('', '', string.punctuation)
+
+
+class TextNormalizer():
+    '''
+    Cleans strings before the intention recognition: lowercase, non ascii
+    characters, quoted strings, numbers, the bot's name, youtube urls and
+    punctuation are removed.
+
+    Results are cached (users tend to repeat the same commands) so calling
+    it twice with the same string is almost free.
+
+    .. note::
+        Removing numbers can bring the bot's name together with whitespace
+        (*eri2 hola*) so the name and url passes are not merged with the
+        arguments pass, the output is the same the bot always had.
+    '''
+    def __init__(self, cache_size=4096):
+        '''
+        Args:
+            cache_size(int): How many cleaned strings are kept in memory.
+        '''
+        self.normalize = lru_cache(maxsize=cache_size)(self._normalize)
+
+    def __call__(self, text):
+        return self.normalize(text)
+
+    def _normalize(self, text):
+        text = unidecode.unidecode(text.lower())
+        text = ARGUMENTS.sub("", text)
+        text = BOT_NAME.sub("", text)
+        text = YT_URL.sub("", text)
+
+        return text.translate(PUNCTUATION)
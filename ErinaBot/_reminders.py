@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+
+"""
+The MIT License (MIT)
+
+Copyright (c) 2020 edo0xff
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+import time
+import uuid
+import heapq
+import asyncio
+
+from pymongo import ASCENDING
+
+
+class ReminderScheduler():
+    '''
+    Sends the reminders stored in a collection when they expire. Reminders
+    are documents with an *expiration* unix time.
+
+    The reminders expiring in the next *horizon* seconds are kept in a heap
+    (loaded with an indexed range query) and the scheduler sleeps until the
+    next one is due. New reminders are added with :meth:`add`, which wakes
+    the scheduler up. Every *sync_interval* seconds the heap is loaded again
+    from the database so reminders created by other processes, or pending
+    after a crash, are not lost.
+
+    Due reminders are claimed in bulk (tagged with a claim token and a lease)
+    before sending them, so several bot processes can share the collection
+    without sending a reminder twice. They are sent concurrently (at most
+    *channel_concurrency* at once per channel) and deleted with a single
+    bulk write. Reminders that fail are sent again when their lease expires,
+    up to *max_attempts* times.
+
+    .. code-block:: python
+
+        async def send_reminder(reminder):
+            channel = client.get_channel(reminder['channel'])
+            await channel.send(reminder['message'])
+
+        reminders = erina.ReminderScheduler(erina.database.notifications, send_reminder)
+
+        @client.event
+        async def on_ready():
+            reminders.start(client.loop)
+    '''
+    def __init__(self, collection, deliver, horizon=3600, sync_interval=300, lease=60,
+                    channel_concurrency=2, max_attempts=3):
+        '''
+        Args:
+            collection(ErinaBot._database.AsyncCollection): Reminders collection.
+            deliver(coroutine function): Called with each expired reminder.
+            horizon(float): Seconds ahead loaded in memory.
+            sync_interval(float): Seconds between database syncs.
+            lease(float): Seconds a claimed reminder belongs to this process.
+            channel_concurrency(int): Reminders sent at once to a channel.
+            max_attempts(int): Times a reminder is tried before dropping it.
+        '''
+        self.collection = collection
+        self.deliver = deliver
+        self.horizon = horizon
+        self.sync_interval = sync_interval
+        self.lease = lease
+        self.channel_concurrency = channel_concurrency
+        self.max_attempts = max_attempts
+
+        # (expiration, id, reminder)
+        self.heap = []
+        self.scheduled = set()
+        # created by start, in the event loop
+        self.wakeup = None
+        self.next_sync = 0
+        self.task = None
+
+        self.delivered = 0
+        self.failed = 0
+        self.syncs = 0
+
+    def start(self, loop):
+        '''
+        Starts the scheduler task (on_ready can be called several times, the
+        task is started once).
+
+        Args:
+            loop(asyncio.AbstractEventLoop): We get this from *client.loop*.
+
+        Returns:
+            asyncio.Task: Scheduler task.
+        '''
+        if self.task and not self.task.done():
+            return self.task
+
+        self.wakeup = asyncio.Event()
+        self.task = loop.create_task(self.__scheduler_worker())
+        return self.task
+
+    def add(self, reminder):
+        '''
+        Schedules a reminder that was just inserted (it must have its *_id*).
+
+        Args:
+            reminder(dict): Reminder document.
+        '''
+        if reminder['expiration'] > time.time() + self.horizon:
+            # the sync loads it when it gets closer
+            return
+
+        self.__push(reminder)
+
+        if self.wakeup:
+            self.wakeup.set()
+
+    async def sync(self):
+        '''
+        Loads the reminders expiring in the next *horizon* seconds.
+        '''
+        self.next_sync = time.time() + self.sync_interval
+
+        reminders = await self.collection.find(
+            {'expiration': {'$lte': time.time() + self.horizon}},
+            sort=[('expiration', ASCENDING)])
+
+        self.heap = []
+        self.scheduled = set()
+
+        for reminder in reminders:
+            # claimed ones can be tried again when their lease expires
+            self.__push(reminder, max(reminder['expiration'], reminder.get('lease') or 0))
+
+        self.syncs += 1
+
+    def stats(self):
+        '''
+        Scheduler statistics.
+
+        Returns:
+            dict: *scheduled* reminders, *delivered* and *failed* ones and
+                    database *syncs*.
+        '''
+        return {
+            'scheduled': len(self.heap),
+            'delivered': self.delivered,
+            'failed': self.failed,
+            'syncs': self.syncs,
+        }
+
+    def __push(self, reminder, due=None):
+        '''
+        Schedules a reminder at its expiration, or at *due* (unix time).
+        '''
+        if reminder['_id'] in self.scheduled:
+            return
+
+        self.scheduled.add(reminder['_id'])
+        due = reminder['expiration'] if due is None else due
+        heapq.heappush(self.heap, (due, str(reminder['_id']), reminder))
+
+    async def __deliver_due(self):
+        '''
+        Claims, sends and deletes the expired reminders.
+        '''
+        now = time.time()
+
+        while self.heap and self.heap[0][0] <= now:
+            expiration, _, reminder = heapq.heappop(self.heap)
+            self.scheduled.discard(reminder['_id'])
+
+        # reminders claimed by another process are skipped until the lease expires
+        token = uuid.uuid4().hex
+        await self.collection.update_many(
+            {'expiration': {'$lte': now},
+             '$or': [{'claim': None}, {'lease': {'$lte': now}}]},
+            {'$set': {'claim': token, 'lease': now + self.lease}, '$inc': {'attempts': 1}})
+
+        reminders = await self.collection.find({'claim': token})
+
+        if not reminders:
+            return
+
+        channels = {}
+        results = await asyncio.gather(*[self.__send(reminder, channels) for reminder in reminders])
+
+        done = []
+
+        for reminder, sent in zip(reminders, results):
+            if sent or reminder['attempts'] >= self.max_attempts:
+                done.append(reminder['_id'])
+
+            else:
+                # tried again when the lease expires, not at the next sync
+                self.__push(reminder, now + self.lease)
+
+        if done:
+            await self.collection.delete_many({'_id': {'$in': done}, 'claim': token})
+
+    async def __send(self, reminder, channels):
+        semaphore = channels.setdefault(reminder.get('channel'),
+                                        asyncio.Semaphore(self.channel_concurrency))
+
+        async with semaphore:
+            try:
+                await self.deliver(reminder)
+                self.delivered += 1
+                return True
+
+            except Exception as e:
+                print("ReminderError: couldn't send reminder: %s" %(e))
+                self.failed += 1
+                return False
+
+    async def __scheduler_worker(self):
+        await self.collection.create_index('expiration')
+        # not sparse, claims are looked up with {'claim': None} too
+        await self.collection.create_index('claim')
+
+        while True:
+            try:
+                if time.time() >= self.next_sync:
+                    await self.sync()
+
+                if self.heap and self.heap[0][0] <= time.time():
+                    await self.__deliver_due()
+
+            except Exception as e:
+                print("ReminderError: %s" %(e))
+                self.next_sync = time.time() + 5
+
+            now = time.time()
+            timeout = self.next_sync - now
+
+            if self.heap:
+                timeout = min(timeout, self.heap[0][0] - now)
+
+            self.wakeup.clear()
+
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), max(timeout, 0))
+
+            except asyncio.TimeoutError:
+                pass
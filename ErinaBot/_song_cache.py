@@ -0,0 +1,773 @@
+# -*- coding: utf-8 -*-
+
+"""
+The MIT License (MIT)
+
+Copyright (c) 2020 edo0xff
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+import unidecode
+import subprocess
+import Levenshtein
+
+from collections import OrderedDict
+
+from ._normalizer import PUNCTUATION
+
+VIDEO_ID = re.compile(r'^[A-Za-z0-9_-]{11}$')
+
+# files adopted by the cache, besides the configured extension
+AUDIO_EXTENSIONS = (".mp3", ".opus")
+
+
+def _clean_title(title):
+    return unidecode.unidecode((title or "").lower()).translate(PUNCTUATION).strip()
+
+
+def _title_score(query, title):
+    '''
+    How much a song title looks like the searched text, from 0.0 to 1.0.
+    Titles containing the text score 1.0, otherwise the text is compared
+    with the whole title and with each group of the same number of words.
+    '''
+    if query in title:
+        return 1.0
+
+    score = Levenshtein.ratio(query, title)
+    words = title.split()
+    length = len(query.split())
+
+    for i in range(max(len(words) - length + 1, 1)):
+        score = max(score, Levenshtein.ratio(query, " ".join(words[i:i + length])))
+
+    return score
+
+
+class SongCache():
+    '''
+    Downloaded songs cache. Songs are stored by YouTube video id (not by
+    title) so two videos with the same title don't overwrite each other and
+    renamed videos are not downloaded again.
+
+    An index (*index.json* inside the songs directory) keeps track of the
+    cached songs (id, title, path, duration, size and play count), when they
+    exceed *max_size* bytes the least recently played ones are removed. The
+    index is the songs library too: songs are found by key or path without
+    touching the disk, listed by pages and searched by title.
+
+    Songs waiting in a queue are pinned (see :meth:`pin`), they are not
+    evicted until they play.
+
+    Index changes are saved *save_delay* seconds later in a timer thread (a
+    play or a lookup only marks the index as changed), so playing songs
+    doesn't rewrite the whole index in the event loop. :meth:`flush` saves
+    it right away.
+
+    .. attribute:: hits(int), misses(int)
+        Cache lookups that found (or not) the song.
+
+    .. attribute:: hooks(array[callable])
+        Called with the event (*'add'*, *'update'* or *'remove'*) and the song
+        entry every time the index changes.
+    '''
+    def __init__(self, directory="songs/", max_size=5 * 1024 ** 3, extension="mp3",
+                    save_delay=5.0):
+        '''
+        Args:
+            directory(str): Songs directory.
+            max_size(int): Max bytes used by the cached songs.
+            extension(str): Songs file extension.
+            save_delay(float): Seconds index changes wait before being saved.
+        '''
+        self.directory = directory
+        self.max_size = max_size
+        self.extension = extension
+        self.save_delay = save_delay
+        self.index_path = os.path.join(directory, "index.json")
+
+        self.lock = threading.RLock()
+        # held while the index file is written, outside *lock*
+        self.save_lock = threading.Lock()
+        self.dirty = False
+        self.timer = None
+        self.entries = OrderedDict()
+        self.paths = {}
+        # path -> times it is pinned
+        self.pinned = {}
+        self.titles = None
+        self.size = 0
+        self.hooks = []
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.loaded = False
+
+    def __len__(self):
+        self.__ensure_loaded()
+        return len(self.entries)
+
+    def key(self, video_id):
+        '''
+        Cache key for the given video id, ids that are not safe as file
+        names are hashed.
+
+        Args:
+            video_id(str): YouTube video id.
+
+        Returns:
+            str: Cache key.
+        '''
+        if VIDEO_ID.match(video_id):
+            return video_id
+
+        return hashlib.sha1(video_id.encode('utf-8')).hexdigest()
+
+    def path_for(self, video_id):
+        '''
+        Gets the file path where the song for the given video is stored.
+
+        Args:
+            video_id(str): YouTube video id.
+
+        Returns:
+            str: Song path.
+        '''
+        return os.path.join(self.directory, "%s.%s" %(self.key(video_id), self.extension))
+
+    def get(self, video_id):
+        '''
+        Looks for a cached song. It doesn't do any network call.
+
+        Args:
+            video_id(str): YouTube video id.
+
+        Returns:
+            dict: Song entry (['path'], ['title'], ['thumbnail'], ['size'])
+                    or None if the song is not cached.
+        '''
+        key = self.key(video_id)
+
+        with self.lock:
+            self.__ensure_loaded()
+            entry = self.entries.get(key)
+
+            if entry and not os.path.exists(entry['path']):
+                self.__remove(key, delete=False)
+                self.__changed()
+                entry = None
+
+            if not entry:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            entry['last_access'] = time.time()
+            self.entries.move_to_end(key)
+            self.__changed()
+
+            return dict(entry)
+
+    def add(self, video_id, title, thumbnail, duration=None):
+        '''
+        Registers a downloaded song (it must be in :meth:`path_for`) and
+        evicts old songs if the cache is too big.
+
+        Args:
+            video_id(str): YouTube video id.
+            title(str): Song title.
+            thumbnail(str): Song thumbnail url.
+            duration(int): Song duration in seconds.
+
+        Returns:
+            dict: Song entry.
+        '''
+        key = self.key(video_id)
+        path = self.path_for(video_id)
+
+        with self.lock:
+            self.__ensure_loaded()
+
+            play_count = 0
+
+            if key in self.entries:
+                play_count = self.entries[key]['play_count']
+                self.__remove(key, delete=False, notify=False)
+
+            # the file could have been adopted as untracked when the index loaded
+            other = self.paths.get(os.path.abspath(path))
+
+            if other:
+                play_count = max(play_count, self.entries[other]['play_count'])
+                self.__remove(other, delete=False, notify=False)
+
+            entry = {
+                'key': key,
+                'id': video_id,
+                'path': path,
+                'title': title,
+                'thumbnail': thumbnail,
+                'duration': duration,
+                'size': os.path.getsize(path),
+                'play_count': play_count,
+                'last_access': time.time(),
+            }
+
+            self.__insert(entry)
+            self.__notify('add', entry)
+
+            for old in list(self.entries):
+                if self.size <= self.max_size:
+                    break
+
+                if old == key or os.path.abspath(self.entries[old]['path']) in self.pinned:
+                    continue
+
+                self.__remove(old)
+                self.evictions += 1
+
+            self.__changed()
+
+            return dict(entry)
+
+    def find(self, key=None, path=None):
+        '''
+        Gets a cached song by its key or its path, without touching the disk
+        or updating its last access.
+
+        Args:
+            key(str): Cache key (entry ['key']).
+            path(str): Song path.
+
+        Returns:
+            dict: Song entry or None.
+        '''
+        with self.lock:
+            self.__ensure_loaded()
+
+            if key is None and path is not None:
+                key = self.paths.get(os.path.abspath(path))
+
+            entry = self.entries.get(key)
+
+            return dict(entry) if entry else None
+
+    def pin(self, path):
+        '''
+        Keeps the song in the given path from being evicted (it is queued or
+        being downloaded) until :meth:`unpin` is called as many times. The
+        song doesn't need to be cached yet.
+
+        Args:
+            path(str): Song path.
+        '''
+        path = os.path.abspath(path)
+
+        with self.lock:
+            self.pinned[path] = self.pinned.get(path, 0) + 1
+
+    def unpin(self, path):
+        '''
+        Releases a :meth:`pin` of the song in the given path.
+
+        Args:
+            path(str): Song path.
+        '''
+        path = os.path.abspath(path)
+
+        with self.lock:
+            count = self.pinned.pop(path, 0) - 1
+
+            if count > 0:
+                self.pinned[path] = count
+
+    def played(self, path):
+        '''
+        Counts a play of the song in the given path (if it is cached).
+
+        Args:
+            path(str): Song path.
+        '''
+        with self.lock:
+            self.__ensure_loaded()
+            key = self.paths.get(os.path.abspath(path))
+
+            if not key:
+                return
+
+            entry = self.entries[key]
+            entry['play_count'] += 1
+            entry['last_access'] = time.time()
+            self.entries.move_to_end(key)
+            self.__changed()
+
+            self.__notify('update', entry)
+
+    def page(self, number, size=25):
+        '''
+        Gets a page of the cached songs sorted by title.
+
+        Args:
+            number(int): Page number, from 0.
+            size(int): Songs per page.
+
+        Returns:
+            tuple(songs, pages): Song entries in the page and number of pages.
+        '''
+        with self.lock:
+            self.__ensure_loaded()
+
+            if self.titles is None:
+                self.titles = sorted(self.entries,
+                                key=lambda key: _clean_title(self.entries[key]['title']))
+
+            pages = max((len(self.titles) + size - 1) // size, 1)
+            keys = self.titles[number * size:(number + 1) * size]
+
+            return [dict(self.entries[key]) for key in keys], pages
+
+    def search(self, query, limit=10, min_score=0.6):
+        '''
+        Looks for cached songs by title, typos and partial titles are fine.
+
+        Args:
+            query(str): Searched text.
+            limit(int): Max songs returned.
+            min_score(float): Minimum similarity (0.0 to 1.0) between the
+                                text and the title.
+
+        Returns:
+            array[dict]: Song entries, best matches first.
+        '''
+        query = _clean_title(query)
+
+        if not query:
+            return []
+
+        with self.lock:
+            self.__ensure_loaded()
+            scored = []
+
+            for entry in self.entries.values():
+                score = _title_score(query, _clean_title(entry['title']))
+
+                if score >= min_score:
+                    scored.append((score, entry['play_count'], entry))
+
+            scored.sort(key=lambda item: (item[0], item[1]), reverse=True)
+
+            return [dict(entry) for score, play_count, entry in scored[:limit]]
+
+    def songs(self):
+        '''
+        Gets the cached songs.
+
+        Returns:
+            array[dict]: Song entries, least recently played first.
+        '''
+        with self.lock:
+            self.__ensure_loaded()
+            return [dict(entry) for entry in self.entries.values()]
+
+    def replace_file(self, key, path):
+        '''
+        Replaces the file of a cached song (by example after converting it).
+        The old file is removed.
+
+        Args:
+            key(str): Cache key (entry ['key']).
+            path(str): New song path.
+
+        Returns:
+            dict: Song entry.
+        '''
+        with self.lock:
+            self.__ensure_loaded()
+            entry = self.entries[key]
+
+            old_path = entry['path']
+            size = os.path.getsize(path)
+
+            self.size += size - entry['size']
+            self.paths.pop(os.path.abspath(old_path), None)
+            self.paths[os.path.abspath(path)] = key
+            entry['path'] = path
+            entry['size'] = size
+            self.__changed()
+
+            self.__notify('update', entry)
+
+        if os.path.abspath(old_path) != os.path.abspath(path):
+            os.remove(old_path)
+
+        return dict(entry)
+
+    def flush(self):
+        '''
+        Saves the index if it has unsaved changes.
+        '''
+        with self.save_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+
+                if self.timer:
+                    self.timer.cancel()
+
+                self.dirty = False
+                self.timer = None
+                entries = [dict(entry) for entry in self.entries.values()]
+
+            tmp_path = self.index_path + ".tmp"
+
+            try:
+                with open(tmp_path, 'w') as f:
+                    json.dump(entries, f)
+
+                os.replace(tmp_path, self.index_path)
+
+            except Exception:
+                with self.lock:
+                    self.__changed()
+
+                raise
+
+    def stats(self):
+        '''
+        Cache statistics.
+
+        Returns:
+            dict: *songs*, *size*, *max_size*, *hits*, *misses* and *evictions*.
+        '''
+        return {
+            'songs': len(self.entries),
+            'size': self.size,
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    def __insert(self, entry):
+        entry.setdefault('duration', None)
+        entry.setdefault('play_count', 0)
+
+        self.entries[entry['key']] = entry
+        self.paths[os.path.abspath(entry['path'])] = entry['key']
+        self.size += entry['size']
+        self.titles = None
+
+    def __remove(self, key, delete=True, notify=True):
+        entry = self.entries.pop(key)
+        self.paths.pop(os.path.abspath(entry['path']), None)
+        self.size -= entry['size']
+        self.titles = None
+
+        if notify:
+            self.__notify('remove', entry)
+
+        if delete:
+            try:
+                os.remove(entry['path'])
+
+            except OSError:
+                pass
+
+    def __ensure_loaded(self):
+        '''
+        The index is loaded on first use, not when the bot is imported.
+        '''
+        with self.lock:
+            if not self.loaded:
+                os.makedirs(self.directory, exist_ok=True)
+                self.__load()
+                self.loaded = True
+
+    def __load(self):
+        '''
+        Loads the index. Songs downloaded before the cache existed (named by
+        title) are added too so they can be listed and evicted.
+        '''
+        try:
+            with open(self.index_path) as f:
+                entries = json.load(f)
+
+        except (OSError, ValueError):
+            entries = []
+
+        entries.sort(key=lambda entry: entry['last_access'])
+
+        for entry in entries:
+            if os.path.exists(entry['path']):
+                self.__insert(entry)
+
+        untracked = False
+
+        extensions = AUDIO_EXTENSIONS + (".%s" %(self.extension),)
+
+        for file in os.scandir(self.directory):
+            # youtube_dl leaves other files while it downloads (.webm, .part...)
+            if not file.is_file() or os.path.splitext(file.name)[1] not in extensions\
+                or os.path.abspath(file.path) in self.paths:
+                continue
+
+            key = hashlib.sha1(file.name.encode('utf-8')).hexdigest()
+            stat = file.stat()
+
+            self.__insert({
+                'key': key,
+                'id': None,
+                'path': file.path,
+                'title': os.path.splitext(file.name)[0],
+                'thumbnail': None,
+                'size': stat.st_size,
+                'last_access': stat.st_mtime,
+            })
+            untracked = True
+
+        if untracked:
+            self.entries = OrderedDict(sorted(self.entries.items(),
+                                        key=lambda item: item[1]['last_access']))
+            self.__changed()
+
+    def __notify(self, event, entry):
+        for hook in self.hooks:
+            try:
+                hook(event, dict(entry))
+
+            except Exception as e:
+                print("SongCacheError: %s hook failed: %s" %(event, e))
+
+    def __changed(self):
+        self.dirty = True
+
+        if self.timer is None:
+            # not a daemon, pending changes are saved before the process exits
+            self.timer = threading.Timer(self.save_delay, self.__flush_worker)
+            self.timer.start()
+
+    def __flush_worker(self):
+        try:
+            self.flush()
+
+        except Exception as e:
+            print("SongCacheError: couldn't save the index: %s" %(e))
+
+
+class MetadataStore():
+    '''
+    YouTube videos metadata (title, thumbnail, duration) by video id, saved
+    in a json file. Metadata is kept even if the song is evicted from the
+    cache so playing it again doesn't need to scrape the video page.
+
+    Only the *max_videos* most recently used videos are kept, and like the
+    :class:`SongCache` index, changes are saved *save_delay* seconds later
+    in a timer thread (:meth:`flush` saves them right away), a download
+    doesn't rewrite the whole file.
+    '''
+    def __init__(self, path="songs/metadata.json", max_videos=20000, save_delay=5.0):
+        '''
+        Args:
+            path(str): Json file path.
+            max_videos(int): Max videos kept.
+            save_delay(float): Seconds changes wait before being saved.
+        '''
+        self.path = path
+        self.max_videos = max_videos
+        self.save_delay = save_delay
+        self.lock = threading.RLock()
+        # held while the file is written, outside *lock*
+        self.save_lock = threading.Lock()
+        self.dirty = False
+        self.timer = None
+        # least recently used first
+        self.videos = None
+
+    def __len__(self):
+        with self.lock:
+            self.__ensure_loaded()
+            return len(self.videos)
+
+    def get(self, video_id):
+        '''
+        Gets the metadata of a video.
+
+        Args:
+            video_id(str): YouTube video id.
+
+        Returns:
+            dict: Video metadata (['id'], ['title'], ['thumbnail'], ['duration']
+                    and ['url']) or None if it is unknown.
+        '''
+        with self.lock:
+            self.__ensure_loaded()
+            video = self.videos.get(video_id)
+
+            if not video:
+                return None
+
+            # the order is saved with the next change
+            self.videos.move_to_end(video_id)
+
+            return dict(video)
+
+    def add(self, info):
+        '''
+        Stores the metadata of a video.
+
+        Args:
+            info(dict): youtube_dl *extract_info* result.
+
+        Returns:
+            dict: Stored metadata.
+        '''
+        video = {
+            'id': info['id'],
+            'title': info.get('title'),
+            'thumbnail': info.get('thumbnail'),
+            'duration': info.get('duration'),
+            'url': info.get('webpage_url') or "https://www.youtube.com/watch?v=%s" %(info['id']),
+        }
+
+        with self.lock:
+            self.__ensure_loaded()
+            self.videos.pop(video['id'], None)
+            self.videos[video['id']] = video
+
+            while len(self.videos) > self.max_videos:
+                self.videos.popitem(last=False)
+
+            self.__changed()
+
+        return dict(video)
+
+    def flush(self):
+        '''
+        Saves the metadata if it has unsaved changes.
+        '''
+        with self.save_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+
+                if self.timer:
+                    self.timer.cancel()
+
+                self.dirty = False
+                self.timer = None
+                videos = dict(self.videos)
+
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = self.path + ".tmp"
+
+            try:
+                with open(tmp_path, 'w') as f:
+                    json.dump(videos, f)
+
+                os.replace(tmp_path, self.path)
+
+            except Exception:
+                with self.lock:
+                    self.__changed()
+
+                raise
+
+    def __ensure_loaded(self):
+        if self.videos is not None:
+            return
+
+        try:
+            with open(self.path) as f:
+                self.videos = OrderedDict(json.load(f))
+
+        except (OSError, ValueError):
+            self.videos = OrderedDict()
+
+        while len(self.videos) > self.max_videos:
+            self.videos.popitem(last=False)
+
+    def __changed(self):
+        self.dirty = True
+
+        if self.timer is None:
+            # not a daemon, pending changes are saved before the process exits
+            self.timer = threading.Timer(self.save_delay, self.__flush_worker)
+            self.timer.start()
+
+    def __flush_worker(self):
+        try:
+            self.flush()
+
+        except Exception as e:
+            print("MetadataStoreError: couldn't save the metadata: %s" %(e))
+
+
+def convert_to_opus(cache, bitrate="128k", on_converted=None):
+    '''
+    Converts the cached songs to Ogg/Opus so they can be played without
+    transcoding. Songs that are already .opus files are skipped.
+
+    Args:
+        cache(ErinaBot._song_cache.SongCache): Songs cache.
+        bitrate(str): Opus bitrate.
+        on_converted(callable): Called with the old and the new path of each
+                                converted song.
+
+    Returns:
+        tuple(converted, failed): How many songs were converted or failed.
+    '''
+    converted = 0
+    failed = 0
+
+    for entry in cache.songs():
+        if entry['path'].endswith(".opus"):
+            continue
+
+        path = os.path.splitext(entry['path'])[0] + ".opus"
+        tmp_path = path + ".tmp"
+
+        result = subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-i", entry['path'],
+                                    "-vn", "-c:a", "libopus", "-b:a", bitrate,
+                                    "-f", "ogg", tmp_path])
+
+        if result.returncode != 0:
+            print("SongCacheError: couldn't convert '%s'" %(entry['path']))
+            failed += 1
+
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+            continue
+
+        os.replace(tmp_path, path)
+        cache.replace_file(entry['key'], path)
+        converted += 1
+
+        if on_converted:
+            on_converted(entry['path'], path)
+
+    return converted, failed
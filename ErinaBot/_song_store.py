@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+"""
+The MIT License (MIT)
+
+Copyright (c) 2020 edo0xff
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+import asyncio
+
+from pymongo import ASCENDING, UpdateOne
+
+from ._music_player import yt_video_id
+
+SONG_FIELDS = ('path', 'title', 'thumbnail', 'url', 'requested_by')
+
+
+class SongStore():
+    '''
+    Played songs metadata stored in a MongoDB collection, one document per
+    YouTube video (saving a song again updates its document). The bot
+    doesn't read it back, the songs it plays are found in the local songs
+    cache (*MusicPlayer.cache*).
+
+    .. code-block:: python
+
+        song_store = erina.SongStore(erina.db.songs)
+
+        @client.event
+        async def on_ready():
+            client.loop.create_task(song_store.create_indexes_async())
+
+        erina.music.enqueue(client, ctx, voice_channel, url, on_resolved=song_store.save_async)
+
+    Documents saved before the store existed can have duplicates, see
+    :meth:`compact` (*compact_songs.py*).
+    '''
+    def __init__(self, collection):
+        '''
+        Args:
+            collection(pymongo.collection.Collection): Songs collection.
+        '''
+        self.collection = collection
+
+    def create_indexes(self):
+        '''
+        Creates the collection indexes. It connects to MongoDB, so it isn't
+        done when the store is created (the bot would wait for MongoDB while
+        it starts).
+        '''
+        # old documents don't have video_id, a sparse index lets them be
+        self.collection.create_index('video_id', unique=True, sparse=True)
+        self.collection.create_index([('path', ASCENDING)])
+
+    async def create_indexes_async(self):
+        '''
+        Same as :meth:`create_indexes` but it runs in an executor, errors are
+        printed. Call it when the bot is ready.
+        '''
+        try:
+            await asyncio.get_event_loop().run_in_executor(None, self.create_indexes)
+
+        except Exception as e:
+            print("SongStoreError: couldn't create the indexes: %s" %(e))
+
+    def save(self, metadata):
+        '''
+        Saves (inserts or updates) a song by its video id.
+
+        Args:
+            metadata(dict): Song metadata (see :meth:`MusicPlayer.play`).
+
+        Returns:
+            dict: Saved document, None if the song url isn't a YouTube video.
+        '''
+        video_id = yt_video_id(metadata.get('url') or "")
+
+        if not video_id:
+            return None
+
+        document = {field: metadata.get(field) for field in SONG_FIELDS}
+        document['video_id'] = video_id
+
+        self.collection.update_one({'video_id': video_id}, {'$set': document}, upsert=True)
+
+        return dict(document)
+
+    async def save_async(self, metadata):
+        '''
+        Same as :meth:`save` but it runs in an executor, it doesn't block
+        the event loop.
+        '''
+        return await asyncio.get_event_loop().run_in_executor(None, self.save, metadata)
+
+    def update_path(self, old_path, path):
+        '''
+        Changes the path of the songs stored in *old_path*.
+
+        Args:
+            old_path(str): Current song path.
+            path(str): New song path.
+        '''
+        self.collection.update_many({'path': old_path}, {'$set': {'path': path}})
+
+    def compact(self):
+        '''
+        Collapses duplicated songs (saved before the store existed) into one
+        document per video: the newest document is kept and gets its
+        *video_id*, the other ones are removed.
+
+        Returns:
+            tuple(kept, removed): Songs kept and duplicated documents removed.
+        '''
+        videos = {}
+        duplicates = []
+
+        # ObjectIds grow with time, newest document last
+        for document in self.collection.find({}, {'url': 1, 'video_id': 1}).sort('_id', ASCENDING):
+            video_id = document.get('video_id') or yt_video_id(document.get('url') or "")
+
+            if not video_id:
+                continue
+
+            if video_id in videos:
+                previous = videos[video_id]
+
+                # the document already indexed by video id must stay
+                if previous.get('video_id') and not document.get('video_id'):
+                    duplicates.append(document['_id'])
+                    continue
+
+                duplicates.append(previous['_id'])
+
+            videos[video_id] = document
+
+        if duplicates:
+            self.collection.delete_many({'_id': {'$in': duplicates}})
+
+        operations = [UpdateOne({'_id': document['_id']}, {'$set': {'video_id': video_id}})
+                        for video_id, document in videos.items() if not document.get('video_id')]
+
+        if operations:
+            self.collection.bulk_write(operations, ordered=False)
+
+        return len(videos), len(duplicates)
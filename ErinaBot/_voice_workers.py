@@ -0,0 +1,463 @@
+# -*- coding: utf-8 -*-
+
+"""
+The MIT License (MIT)
+
+Copyright (c) 2020 edo0xff
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+import os
+import sys
+import queue
+import itertools
+import threading
+import subprocess
+
+import discord
+
+from discord.opus import Encoder
+from multiprocessing.connection import Listener, Client
+
+# Messages sent to the workers:
+#   ('play', stream, metadata, volume, credits), ('volume', stream, volume),
+#   ('credit', stream, frames), ('stop', stream), ('exit',)
+# Messages sent by the workers:
+#   ('frame', stream, opus_packet), ('end', stream, (error, recorded))
+
+# workers are started with "python -c" instead of multiprocessing spawn, which
+# would run the bot script (main.py) again in every worker. An empty ErinaBot
+# package is registered so its __init__ (conversation, music player,
+# database...) doesn't run, the worker only imports this module and _audio.
+WORKER_COMMAND = "; ".join([
+    "import sys, types",
+    "package = types.ModuleType('ErinaBot')",
+    "package.__path__ = [sys.argv[2]]",
+    "sys.modules['ErinaBot'] = package",
+    "from ErinaBot._voice_workers import run_worker",
+    "run_worker(sys.argv[1])",
+])
+AUTHKEY_ENV = "ERINA_VOICE_WORKER_KEY"
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+#: Frames consumed before giving the credits back to the worker.
+CREDIT_BATCH = 10
+
+#: Seconds a source waits for a frame before ending the song.
+READ_TIMEOUT = 10.0
+
+
+class _WorkerStream():
+    '''
+    Worker side of a song: it reads the FFmpeg output, applies the volume and
+    encodes the frames to Opus. It sends a frame for every credit it gets so
+    it stays at most *credits* frames ahead of the voice client.
+    '''
+    def __init__(self, stream_id, metadata, volume, credits, send, streams):
+        self.stream_id = stream_id
+        self.metadata = metadata
+        self.volume = volume
+        self.credits = threading.Semaphore(credits)
+        self.send = send
+        self.streams = streams
+        self.source = None
+        self.stopped = False
+
+    def set_volume(self, volume):
+        self.volume = volume
+
+        # opus sources keep their volume until the next song
+        if isinstance(self.source, discord.PCMVolumeTransformer):
+            self.source.volume = volume
+
+    def add_credits(self, frames):
+        for _ in range(frames):
+            self.credits.release()
+
+    def stop(self):
+        self.stopped = True
+        self.credits.release()
+
+    def run(self):
+        from ._audio import create_audio_source
+
+        error = None
+        recorded = False
+
+        try:
+            self.source = create_audio_source(self.metadata, self.volume)
+            encoder = None if self.source.is_opus() else Encoder()
+
+            while not self.stopped:
+                self.credits.acquire()
+
+                if self.stopped:
+                    break
+
+                data = self.source.read()
+
+                if not data:
+                    break
+
+                if encoder:
+                    data = encoder.encode(data, Encoder.SAMPLES_PER_FRAME)
+
+                self.send(('frame', self.stream_id, data))
+
+        except Exception as e:
+            error = "%s: %s" %(type(e).__name__, e)
+
+        finally:
+            if self.source:
+                self.source.cleanup()
+                # see MusicPlayer.finish_recording
+                recorded = getattr(getattr(self.source, 'original', self.source), 'recorded', False)
+
+            self.streams.pop(self.stream_id, None)
+
+            try:
+                self.send(('end', self.stream_id, (error, recorded)))
+
+            except OSError:
+                pass
+
+
+def _worker_main(connection):
+    '''
+    Voice worker process entry point. Every song runs in its own thread,
+    control messages are read here.
+    '''
+    lock = threading.Lock()
+    streams = {}
+
+    def send(message):
+        with lock:
+            connection.send(message)
+
+    while True:
+        try:
+            message = connection.recv()
+
+        except (EOFError, OSError):
+            break
+
+        command = message[0]
+
+        if command == 'exit':
+            break
+
+        if command == 'play':
+            stream_id, metadata, volume, credits = message[1:]
+            stream = _WorkerStream(stream_id, metadata, volume, credits, send, streams)
+            streams[stream_id] = stream
+
+            threading.Thread(target=stream.run, daemon=True).start()
+            continue
+
+        stream = streams.get(message[1])
+
+        if stream is None:
+            continue
+
+        if command == 'volume':
+            stream.set_volume(message[2])
+
+        elif command == 'credit':
+            stream.add_credits(message[2])
+
+        elif command == 'stop':
+            stream.stop()
+
+    for stream in list(streams.values()):
+        stream.stop()
+
+
+def run_worker(address):
+    '''
+    Connects to the bot process and runs the worker until the bot exits.
+
+    Args:
+        address(str): Bot process listener address.
+    '''
+    authkey = bytes.fromhex(os.environ.pop(AUTHKEY_ENV))
+    _worker_main(Client(address, authkey=authkey))
+
+
+class WorkerAudioSource(discord.AudioSource):
+    '''
+    Audio source played from a voice worker process. Frames arrive already
+    encoded to Opus so the voice client only sends them.
+
+    .. attribute:: volume(float)
+        Setting it sends the new volume to the worker.
+
+    .. attribute:: recorded(bool)
+        The song was recorded whole (see *MusicPlayer.finish_recording*).
+    '''
+    def __init__(self, worker, stream_id, volume):
+        self.worker = worker
+        self.stream_id = stream_id
+        self.packets = queue.Queue()
+        self.consumed = 0
+        self.ended = False
+        self.recorded = False
+        self.closed = False
+        self._volume = volume
+
+    @property
+    def volume(self):
+        return self._volume
+
+    @volume.setter
+    def volume(self, value):
+        self._volume = value
+        self.worker.send(('volume', self.stream_id, value))
+
+    def is_opus(self):
+        return True
+
+    def read(self):
+        if self.ended:
+            return b''
+
+        try:
+            packet = self.packets.get(timeout=READ_TIMEOUT)
+
+        except queue.Empty:
+            print("VoiceWorkerError: song %i timed out" %(self.stream_id))
+            packet = None
+
+        if packet is None:
+            self.ended = True
+            return b''
+
+        self.consumed += 1
+
+        if self.consumed >= CREDIT_BATCH:
+            self.worker.send(('credit', self.stream_id, self.consumed))
+            self.consumed = 0
+
+        return packet
+
+    def cleanup(self):
+        # voice client and queue worker both call it
+        if self.closed:
+            return
+
+        self.closed = True
+        self.worker.streams.pop(self.stream_id, None)
+
+        if not self.ended:
+            self.worker.send(('stop', self.stream_id))
+
+
+class _Worker():
+    '''
+    Main process side of a voice worker: it starts the process, owns the
+    connection and runs a thread that routes the received frames to their
+    audio sources. Messages sent before the worker connects are kept and
+    sent when it does, so starting a worker doesn't block the event loop.
+    '''
+    def __init__(self):
+        authkey = os.urandom(16)
+        self.listener = Listener(authkey=authkey)
+
+        env = dict(os.environ)
+        env[AUTHKEY_ENV] = authkey.hex()
+
+        self.process = subprocess.Popen([sys.executable, "-c", WORKER_COMMAND,
+                                            str(self.listener.address), PACKAGE_DIR], env=env)
+
+        self.lock = threading.Lock()
+        self.connection = None
+        self.backlog = []
+        self.streams = {}
+        self.reader = threading.Thread(target=self.__read_worker, daemon=True)
+        self.reader.start()
+
+    def is_alive(self):
+        return self.process.poll() is None
+
+    def send(self, message):
+        with self.lock:
+            if self.connection is None:
+                self.backlog.append(message)
+                return
+
+            try:
+                self.connection.send(message)
+
+            except (OSError, ValueError):
+                # the worker died, the reader ends its songs
+                pass
+
+    def close(self):
+        self.send(('exit',))
+
+        try:
+            self.process.wait(timeout=5)
+
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+        self.listener.close()
+
+    def __connect(self):
+        connection = self.listener.accept()
+
+        with self.lock:
+            for message in self.backlog:
+                connection.send(message)
+
+            self.connection = connection
+            self.backlog = []
+
+        return connection
+
+    def __read_worker(self):
+        try:
+            connection = self.__connect()
+
+        except (OSError, EOFError) as e:
+            print("VoiceWorkerError: worker didn't connect: %s" %(e))
+            connection = None
+
+        while connection:
+            try:
+                command, stream_id, payload = connection.recv()
+
+            except (EOFError, OSError):
+                break
+
+            source = self.streams.get(stream_id)
+
+            if source is None:
+                continue
+
+            if command == 'frame':
+                source.packets.put(payload)
+
+            else:
+                error, source.recorded = payload
+
+                if error:
+                    print("VoiceWorkerError: %s" %(error))
+
+                source.packets.put(None)
+
+        for source in list(self.streams.values()):
+            source.packets.put(None)
+
+
+class VoiceWorkerPool():
+    '''
+    Pool of processes that decode, apply the volume and encode to Opus the
+    songs being played, so audio work runs out of the bot process (and its
+    GIL) and scales across cores. The discord voice connection stays in the
+    bot process, it only sends the Opus frames it gets from the workers.
+
+    Each song is given to the worker with less songs playing. Workers are
+    started on the first song, dead workers are replaced.
+
+    .. code-block:: python
+
+        erina.music = erina.MusicPlayer(voice_workers=4)
+
+    .. note::
+        FFmpeg processes run by the workers are not counted in
+        *ffmpeg_stats*, see :meth:`stats`.
+    '''
+    def __init__(self, processes=None, buffer_frames=50):
+        '''
+        Args:
+            processes(int): Worker processes, one per cpu by default.
+            buffer_frames(int): Frames a worker encodes ahead of the voice
+                                client (50 frames = 1 second).
+        '''
+        self.processes = processes or os.cpu_count() or 1
+        self.buffer_frames = buffer_frames
+        self.workers = []
+        self.ids = itertools.count()
+        self.lock = threading.Lock()
+
+    def start(self):
+        '''
+        Starts the worker processes that are not running.
+        '''
+        with self.lock:
+            for worker in [worker for worker in self.workers if not worker.is_alive()]:
+                worker.close()
+                self.workers.remove(worker)
+
+            while len(self.workers) < self.processes:
+                self.workers.append(_Worker())
+
+    def create_source(self, metadata, volume=1.0):
+        '''
+        Starts playing a song in a worker.
+
+        Args:
+            metadata(dict): Song metadata (see :meth:`MusicPlayer.play`).
+            volume(float): Volume from 0.0 to 1.0.
+
+        Returns:
+            ErinaBot._voice_workers.WorkerAudioSource: Audio source.
+        '''
+        self.start()
+
+        with self.lock:
+            worker = min(self.workers, key=lambda worker: len(worker.streams))
+            stream_id = next(self.ids)
+
+        source = WorkerAudioSource(worker, stream_id, volume)
+        worker.streams[stream_id] = source
+
+        song = {
+            'path': metadata['path'],
+            'stream_url': metadata.get('stream_url'),
+            'record': metadata.get('record'),
+        }
+
+        worker.send(('play', stream_id, song, volume, self.buffer_frames))
+
+        return source
+
+    def stats(self):
+        '''
+        Pool statistics.
+
+        Returns:
+            dict: *workers* (alive ones) and *songs* playing in each worker.
+        '''
+        with self.lock:
+            return {
+                'workers': sum(1 for worker in self.workers if worker.is_alive()),
+                'songs': [len(worker.streams) for worker in self.workers],
+            }
+
+    def close(self):
+        '''
+        Stops the worker processes.
+        '''
+        with self.lock:
+            for worker in self.workers:
+                worker.close()
+
+            self.workers = []
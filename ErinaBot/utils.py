@@ -7,63 +7,226 @@ ErinaBot Utilities
 Utilities for the example implementation.
 
 Sorry but I'm spanish speaker so example bot implementations are in taco.
+
+Pages are downloaded with the shared HTTP client (*ErinaBot.http*), every
+function accepts another one in *http*. Pages are parsed in an executor so
+the event loop isn't blocked.
 """
 
 import csv
+import time
 import random
+import asyncio
 import unidecode
 
-from requests import get
-from bs4 import BeautifulSoup
+from collections import deque
+
+from . import _extract
+from ._http import shared
+
+COVID_URL = "https://docs.google.com/spreadsheets/d/e/2PACX-1vR30F8lYP3jG7YOq8es0PBpJIE5yvRVZffOyaqC0GgMBN6yt0Q-NI8pxS7hd1F9dYXnowSC6zpZmW9D/pubhtml?gid=0&amp;single=true&amp;widget=true&amp;headers=false&amp;range=A1:I202"
+
+#: Seconds the covid table is kept before downloading it again.
+COVID_TTL = 30 * 60
+
+_covid_table = {'rows': None, 'expiration': 0, 'task': None}
+
+
+async def _parse(parser, html):
+    return await asyncio.get_event_loop().run_in_executor(None, parser, html)
 
-def covid_cases(search):
+
+class ContentPool():
     '''
-    Search for latest covid statistics for the given country.
+    Pool of random content (memes, jokes) downloaded ahead, commands take an
+    item from the pool and it is refilled in background when it runs low.
+    If the pool is empty the content is downloaded right away.
+
+    A refill downloads at most *max_fetches* pages and stops early when a
+    page has nothing new (sites that keep returning the same content).
+    '''
+    def __init__(self, fetch, size=20, low=5, max_fetches=5):
+        '''
+        Args:
+            fetch(coroutine function): Downloads content, returns a list of items.
+            size(int): Items the pool is filled with.
+            low(int): Items left that start a refill.
+            max_fetches(int): Downloads per refill.
+        '''
+        self.fetch = fetch
+        self.size = size
+        self.low = low
+        self.max_fetches = max_fetches
+        self.items = deque()
+        self.task = None
+
+    async def get(self):
+        '''
+        Takes an item from the pool.
+
+        Returns:
+            mixed: Item.
+        '''
+        if self.items:
+            item = self.items.popleft()
+
+        else:
+            items = await self.fetch()
+            random.shuffle(items)
+            item = items.pop()
+            self.__add(items)
+
+        if len(self.items) < self.low:
+            self.refill()
+
+        return item
+
+    def refill(self):
+        '''
+        Fills the pool in a background task (if it isn't being filled).
+
+        Returns:
+            asyncio.Task: Refill task.
+        '''
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self.__refill_worker())
+
+        return self.task
+
+    def __add(self, items):
+        '''
+        Returns:
+            int: Items added.
+        '''
+        added = 0
+
+        for item in items:
+            if len(self.items) < self.size and item not in self.items:
+                self.items.append(item)
+                added += 1
+
+        return added
+
+    async def __refill_worker(self):
+        try:
+            for _ in range(self.max_fetches):
+                if len(self.items) >= self.size:
+                    break
+
+                items = await self.fetch()
+                random.shuffle(items)
+
+                if not self.__add(items):
+                    break
+
+        except Exception as e:
+            print("UtilsError: couldn't refill pool: %s" %(e))
+
+
+def parse_covid_table(html):
+    '''
+    Parses the covid statistics sheet.
 
     Args:
-        search(str): Country name.
+        html(str): Sheet page.
 
     Returns:
-        str: Covid cases or error message if it couldn't find the country statistics.
+        dict: Country (lowercase without accents) -> (country, confirmed,
+                deaths, serious, recovered).
     '''
-    response = get("https://docs.google.com/spreadsheets/d/e/2PACX-1vR30F8lYP3jG7YOq8es0PBpJIE5yvRVZffOyaqC0GgMBN6yt0Q-NI8pxS7hd1F9dYXnowSC6zpZmW9D/pubhtml?gid=0&amp;single=true&amp;widget=true&amp;headers=false&amp;range=A1:I202")
+    table = {}
 
-    soup = BeautifulSoup(response.text, 'lxml')
-    tables = soup.find_all("table")
-    rows = tables[0].find_all("tr")
+    for cells in _extract.covid_rows(html):
+        cells = [unidecode.unidecode(cell) for cell in cells]
 
-    search = search.replace("_"," ")
+        if len(cells) < 8:
+            continue
 
-    for row in rows:
-        cells = row.find_all("td")
-        cells = [unidecode.unidecode(cell.text.strip()) for cell in cells]
+        country = cells[0]
+        table[country.lower()] = (country, cells[1], cells[3], cells[6], cells[7])
 
-        try:
-                country = cells[0]
-                confirmed = cells[1]
-                deaths = cells[3]
-                serious = cells[6]
-                recovered = cells[7]
+    return table
+
+async def _download_covid_table(http, ttl):
+    try:
+        html = await http.get_text(COVID_URL)
+        table = await _parse(parse_covid_table, html)
 
-                if country.lower() == unidecode.unidecode(search.lower()):
-                    return "Casos de Covid-19 en **%s** : %s confirmados %s muertes %s graves %s recuperados\n" % (country, confirmed, deaths, serious, recovered)
+    except Exception:
+        if _covid_table['rows'] is None:
+            raise
 
-        except Exception as e:
-            pass
+        return _covid_table['rows']
+
+    _covid_table['rows'] = table
+    _covid_table['expiration'] = time.time() + ttl
+
+    return table
+
+async def covid_table(ttl=COVID_TTL, http=None):
+    '''
+    Gets the covid statistics table, it is downloaded at most once every
+    *ttl* seconds (concurrent calls wait for the same download). If the
+    download fails the last table is used.
+
+    Args:
+        ttl(float): Seconds the table is cached.
+        http(ErinaBot._http.HTTPClient): HTTP client.
+
+    Returns:
+        dict: Country (lowercase without accents) -> (country, confirmed,
+                deaths, serious, recovered).
+    '''
+    if _covid_table['rows'] is not None and _covid_table['expiration'] > time.time():
+        return _covid_table['rows']
+
+    task = _covid_table['task']
+
+    if task is None or task.done():
+        task = asyncio.ensure_future(_download_covid_table(http or shared, ttl))
+        _covid_table['task'] = task
+
+    return await asyncio.shield(task)
+
+async def covid_cases(search, http=None):
+    '''
+    Search for latest covid statistics for the given country.
+
+    Args:
+        search(str): Country name.
+        http(ErinaBot._http.HTTPClient): HTTP client.
+
+    Returns:
+        str: Covid cases or error message if it couldn't find the country statistics.
+    '''
+    search = search.replace("_"," ")
+    table = await covid_table(http=http)
+    row = table.get(unidecode.unidecode(search.lower()))
+
+    if row:
+        return "Casos de Covid-19 en **%s** : %s confirmados %s muertes %s graves %s recuperados\n" % row
 
     return "Lo siento no pude obtener los datos en este momento :( meper donas?"
 
-def get_nudes():
+def parse_posts(html):
+    '''
+    Returns:
+        array[tuple(file_url, preview_url)]: Posts in a rule34 api page.
+    '''
+    return _extract.posts(html)
+
+async def get_nudes(http=None):
     '''
     ( ͡° ͜ʖ ͡°)
 
+    Args:
+        http(ErinaBot._http.HTTPClient): HTTP client.
+
     Returns:
         tuple(file_url, preview_url): file and thumbnail urls.
     '''
-    response = get("https://rule34.xxx/index.php/index.php?page=dapi&s=post&q=index&tags=Nier&limit=50&pid=%s" %(random.randrange(0,88)))
-
-    soup = BeautifulSoup(response.text, 'lxml')
-    posts = soup.find_all("post")
+    html = await (http or shared).get_text("https://rule34.xxx/index.php/index.php?page=dapi&s=post&q=index&tags=Nier&limit=50&pid=%s" %(random.randrange(0,88)))
+    posts = await _parse(parse_posts, html)
 
     try:
         post = random.choice(posts)
@@ -71,37 +234,79 @@ def get_nudes():
     except:
         return "No encontre ninguno de %s :c" %(topic)
 
-    return post['file_url'], post['preview_url']
+    return post
 
-def get_meme():
+def parse_memes(html):
     '''
-    Gets a random meme.
+    Returns:
+        array[str]: Memes urls in a memedroid page.
+    '''
+    return _extract.memes(html)
+
+async def fetch_memes(http=None):
+    '''
+    Downloads a random memes page.
+
+    Args:
+        http(ErinaBot._http.HTTPClient): HTTP client.
 
     Returns:
-        str: Meme url.
+        array[str]: Memes urls.
     '''
     n = random.randint(1, 200)
-    response = get("https://es.memedroid.com/memes/random/%s" %(n))
+    html = await (http or shared).get_text("https://es.memedroid.com/memes/random/%s" %(n))
 
-    soup = BeautifulSoup(response.text, 'lxml')
-    articles = soup.findAll('article', attrs={'class': 'gallery-item'})
+    return await _parse(parse_memes, html)
 
-    article = random.choice(articles)
-    img = article.find('img')
-    meme = img['src']
+def parse_jokes(html):
+    '''
+    Returns:
+        array[str]: Jokes in a chistes.com page.
+    '''
+    return _extract.jokes(html)
 
-    return meme
+async def fetch_jokes(http=None):
+    '''
+    Downloads a random joke.
+
+    Args:
+        http(ErinaBot._http.HTTPClient): HTTP client.
 
-def get_joke():
+    Returns:
+        array[str]: Jokes.
     '''
-    Gets a random joke.
+    html = await (http or shared).get_text("http://www.chistes.com/chistealazar.asp")
+
+    return await _parse(parse_jokes, html)
+
+#: Memes downloaded ahead.
+memes = ContentPool(fetch_memes, size=30, low=10)
+
+#: Jokes downloaded ahead.
+jokes = ContentPool(fetch_jokes, size=10, low=3)
+
+def prefill():
+    '''
+    Starts filling the memes and jokes pools in background (call it when
+    the bot starts so the first commands are answered from memory).
+    '''
+    memes.refill()
+    jokes.refill()
+
+async def get_meme():
+    '''
+    Gets a random meme.
 
     Returns:
-        str: Joke.
+        str: Meme url.
     '''
-    response = get("http://www.chistes.com/chistealazar.asp")
+    return await memes.get()
 
-    soup = BeautifulSoup(response.text, 'lxml')
-    box = soup.find('div', attrs={'class': 'chiste'})
+async def get_joke():
+    '''
+    Gets a random joke.
 
-    return box.text
+    Returns:
+        str: Joke.
+    '''
+    return await jokes.get()
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+'''
+Scrapers parsing benchmark. It parses saved pages with the previous
+BeautifulSoup parsers and with the lxml XPath ones (*ErinaBot._extract*),
+checks both give the same result and prints the time and the peak memory
+per page.
+
+Memory is the growth of the process peak RSS while the page is parsed,
+every parser runs in its own process (tracemalloc can't see the memory
+libxml2 allocates). On linux the peak is reset before parsing.
+
+By default it runs on *tests/fixtures/pages*, pages with the markup of the
+scraped sites (the real ones change on every request). Real pages can be
+saved with a browser or curl, e.g.:
+
+    $ curl -o memes.html https://es.memedroid.com/memes/random/1
+    $ python3 benchmark_parsing.py --memes memes.html --jokes jokes.html --runs 50
+'''
+import os
+import sys
+import time
+import argparse
+import resource
+import warnings
+import unidecode
+import multiprocessing
+
+from bs4 import BeautifulSoup
+
+from ErinaBot import utils, _extract
+
+# the previous parsers are kept as they were, their bs4 warnings are noise here
+warnings.filterwarnings("ignore", message="It looks like you.re using an HTML parser")
+warnings.filterwarnings("ignore", category=DeprecationWarning)
+
+
+def soup_covid_table(html):
+    soup = BeautifulSoup(html, 'lxml')
+    tables = soup.find_all("table")
+    rows = tables[0].find_all("tr")
+
+    table = {}
+
+    for row in rows:
+        cells = row.find_all("td")
+        cells = [unidecode.unidecode(cell.text.strip()) for cell in cells]
+
+        if len(cells) < 8:
+            continue
+
+        country = cells[0]
+        table[country.lower()] = (country, cells[1], cells[3], cells[6], cells[7])
+
+    return table
+
+
+def soup_posts(html):
+    soup = BeautifulSoup(html, 'lxml')
+    return [(post['file_url'], post['preview_url']) for post in soup.find_all("post")]
+
+
+def soup_memes(html):
+    soup = BeautifulSoup(html, 'lxml')
+    articles = soup.findAll('article', attrs={'class': 'gallery-item'})
+
+    return [article.find('img')['src'] for article in articles if article.find('img')]
+
+
+def soup_jokes(html):
+    soup = BeautifulSoup(html, 'lxml')
+    box = soup.find('div', attrs={'class': 'chiste'})
+
+    return [box.text]
+
+
+def soup_yt_results(html):
+    soup = BeautifulSoup(html, 'lxml')
+    return [(vid['href'], vid['title'])
+                for vid in soup.find_all(attrs={'class':'yt-uix-tile-link'}, limit=10)]
+
+
+#: option -> (previous parser, current parser)
+PARSERS = {
+    'covid': (soup_covid_table, utils.parse_covid_table),
+    'posts': (soup_posts, utils.parse_posts),
+    'memes': (soup_memes, utils.parse_memes),
+    'jokes': (soup_jokes, utils.parse_jokes),
+    'yt': (soup_yt_results, _extract.yt_results),
+}
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tests", "fixtures", "pages")
+
+#: option -> default page
+PAGES = {
+    'covid': "covid.html",
+    'posts': "posts.xml",
+    'memes': "memes.html",
+    'jokes': "jokes.html",
+    'yt': "yt.html",
+}
+
+
+def _status(field):
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith(field):
+                return int(line.split()[1]) * 1024
+
+
+def reset_peak_rss():
+    '''
+    Resets the peak resident memory (linux), the memory used by the imports
+    would hide smaller peaks.
+
+    Returns:
+        int: Resident memory now, in bytes (the peak if it can't be reset).
+    '''
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+
+        return _status("VmRSS:")
+
+    except OSError:
+        return peak_rss()
+
+
+def peak_rss():
+    '''
+    Returns:
+        int: Peak resident memory of this process, in bytes.
+    '''
+    try:
+        return _status("VmHWM:")
+
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # KiB on linux, bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def measure(name, version, path, runs):
+    '''
+    Parses a page, it runs in a new process (see :func:`main`) so the peak
+    memory is only the parser one.
+
+    Args:
+        name(str): Page option.
+        version(int): 0 for the previous parser, 1 for the current one.
+
+    Returns:
+        tuple(result, seconds per run, peak bytes)
+    '''
+    with open(path, encoding='utf-8', errors='replace') as page:
+        html = page.read()
+
+    parser = PARSERS[name][version]
+
+    baseline = reset_peak_rss()
+    result = parser(html)
+    peak = peak_rss() - baseline
+
+    start = time.perf_counter()
+
+    for _ in range(runs):
+        parser(html)
+
+    elapsed = (time.perf_counter() - start) / runs
+
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scrapers parsing benchmark.")
+
+    for name in PARSERS:
+        parser.add_argument("--%s" %(name), metavar="PAGE", help="saved %s page" %(name))
+
+    parser.add_argument("--runs", type=int, default=20, help="times each page is parsed")
+    args = parser.parse_args()
+
+    pages = [(name, getattr(args, name)) for name in PARSERS if getattr(args, name)]
+
+    if not pages:
+        pages = [(name, os.path.join(FIXTURES, page)) for name, page in PAGES.items()]
+
+    # a fresh process per parser, spawn doesn't inherit the parent memory
+    context = multiprocessing.get_context("spawn")
+
+    print("%-8s %12s %12s %12s %12s %8s %6s" %("page", "bs4 (ms)", "lxml (ms)",
+                                                "bs4 (KiB)", "lxml (KiB)", "speedup", "same"))
+
+    different = 0
+
+    for name, path in pages:
+        results = []
+
+        for version in (0, 1):
+            with context.Pool(1) as pool:
+                results.append(pool.apply(measure, (name, version, path, args.runs)))
+
+        (old, old_time, old_peak), (new, new_time, new_peak) = results
+
+        same = old == new
+        different += not same
+
+        print("%-8s %12.2f %12.2f %12.1f %12.1f %7.1fx %6s" %(name, old_time * 1000, new_time * 1000,
+                    old_peak / 1024, new_peak / 1024, old_time / new_time, "yes" if same else "NO"))
+
+    return 1 if different else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+'''
+Voice playback benchmark. It plays a song through MusicPlayer / MusicQueue
+with a fake voice client (no discord connection) that pulls audio frames as
+fast as it can, and measures the time spent per 20ms frame in:
+
+- FFmpeg reading (waiting the decoded PCM or the Opus packets from FFmpeg)
+- PCMVolumeTransformer scaling
+- Opus encoding (what discord.py does for PCM sources)
+
+It also measures the CPU used by the FFmpeg processes (and the voice worker
+processes when *--workers* is given), and estimates how
+many streams one core can sustain for MP3 and Opus cached songs.
+
+Usage:
+
+    $ python3 benchmark_voice.py song.mp3 --frames 3000 --streams 4
+'''
+import os
+import sys
+import time
+import asyncio
+import argparse
+import resource
+import tempfile
+import threading
+import subprocess
+
+from discord.opus import Encoder
+
+import ErinaBot as erina
+
+#: discord sends 20ms frames
+FRAME_LENGTH = 0.02
+
+
+class FrameStats():
+    '''
+    Per frame timings of a played song.
+    '''
+    def __init__(self):
+        self.frames = 0
+        self.read = []
+        self.volume = []
+        self.encode = []
+
+    def merge(self, other):
+        self.frames += other.frames
+        self.read += other.read
+        self.volume += other.volume
+        self.encode += other.encode
+
+
+class FakeVoiceClient():
+    '''
+    Fake discord.VoiceClient, it reads the source frames in a thread like
+    discord.py does but without sleeping between frames.
+    '''
+    def __init__(self, guild_id, frames, stats):
+        self.guild = type("Guild", (), {"id": guild_id})()
+        self.frames = frames
+        self.stats = stats
+        self.source = None
+        self.playing = False
+        self.encoder = Encoder()
+
+    def is_connected(self):
+        return True
+
+    def is_playing(self):
+        return self.playing
+
+    def is_paused(self):
+        return False
+
+    async def disconnect(self):
+        self.playing = False
+
+    def play(self, source, after=None):
+        self.source = source
+        self.playing = True
+
+        thread = threading.Thread(target=self.__run, args=(source, after), daemon=True)
+        thread.start()
+
+    def __run(self, source, after):
+        original = getattr(source, "original", source)
+        original_read = original.read
+        read_time = [0.0]
+
+        def timed_read():
+            start = time.perf_counter()
+            data = original_read()
+            read_time[0] = time.perf_counter() - start
+            return data
+
+        original.read = timed_read
+        is_opus = source.is_opus()
+
+        for _ in range(self.frames):
+            start = time.perf_counter()
+            data = source.read()
+            total = time.perf_counter() - start
+
+            if not data:
+                break
+
+            self.stats.frames += 1
+            self.stats.read.append(read_time[0])
+            self.stats.volume.append(total - read_time[0])
+
+            if not is_opus:
+                start = time.perf_counter()
+                self.encoder.encode(data, Encoder.SAMPLES_PER_FRAME)
+                self.stats.encode.append(time.perf_counter() - start)
+
+        self.playing = False
+        source.cleanup()
+
+        if after:
+            after(None)
+
+
+class FakeTextChannel():
+    async def send(self, *args, **kwargs):
+        pass
+
+
+class FakeMessage():
+    def __init__(self):
+        self.channel = FakeTextChannel()
+        self.author = type("Author", (), {"mention": "@benchmark"})()
+
+
+def children_cpu():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def convert(song, path, codec_options):
+    subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-i", song, "-vn"]
+                    + codec_options + [path], check=True)
+
+
+async def play_streams(player, path, streams, frames, volume):
+    '''
+    Plays the song in *streams* fake voice channels at the same time.
+
+    Returns:
+        tuple(FrameStats, wall_time): Merged stats and elapsed time.
+    '''
+    loop = asyncio.get_event_loop()
+    client = type("Client", (), {"loop": loop})()
+    results = []
+
+    for guild_id in range(streams):
+        stats = FrameStats()
+        voice_channel = FakeVoiceClient(guild_id, frames, stats)
+        results.append((voice_channel, stats))
+
+        queue = player.get_queue(FakeTextChannel(), voice_channel, loop)
+        queue.volume = volume
+
+        player.play(client, FakeMessage(), voice_channel, {
+            'path': path,
+            'title': os.path.basename(path),
+            'thumbnail': None,
+            'url': "",
+            'requested_by': "@benchmark"
+        })
+
+    start = time.perf_counter()
+
+    # wait until every queue starts and finishes its song
+    await asyncio.sleep(0.1)
+    while any(voice_channel.playing for voice_channel, stats in results):
+        await asyncio.sleep(0.05)
+
+    elapsed = time.perf_counter() - start
+
+    for queue in list(player.queues.values()):
+        queue.task.cancel()
+
+    player.queues.clear()
+
+    merged = FrameStats()
+    for voice_channel, stats in results:
+        merged.merge(stats)
+
+    return merged, elapsed
+
+
+def average(values):
+    return sum(values) / len(values) if values else 0.0
+
+
+def percentile(values, percent):
+    if not values:
+        return 0.0
+
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent))]
+
+
+def report(name, stats, ffmpeg_cpu, elapsed):
+    ffmpeg_frame = ffmpeg_cpu / stats.frames if stats.frames else 0.0
+    python_frame = average(stats.volume) + average(stats.encode)
+    cpu_frame = ffmpeg_frame + python_frame
+
+    print("%s (%i frames in %.2fs)" %(name, stats.frames, elapsed))
+    print("  %-18s %10s %10s" %("per frame", "avg (us)", "p99 (us)"))
+
+    for label, values in (("ffmpeg read", stats.read),
+                            ("volume scaling", stats.volume),
+                            ("opus encoding", stats.encode)):
+        print("  %-18s %10.1f %10.1f" %(label, average(values) * 1e6, percentile(values, 0.99) * 1e6))
+
+    print("  %-18s %10.1f" %("ffmpeg cpu", ffmpeg_frame * 1e6))
+    print("  %-18s %10.1f" %("total cpu", cpu_frame * 1e6))
+
+    if cpu_frame:
+        print("  max streams per core: %i" %(FRAME_LENGTH / cpu_frame))
+
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Voice playback per frame benchmark.")
+    parser.add_argument("song", help="any audio file FFmpeg can read")
+    parser.add_argument("--frames", type=int, default=3000,
+                        help="frames played per stream (3000 = 1 minute)")
+    parser.add_argument("--streams", type=int, default=1, help="concurrent streams")
+    parser.add_argument("--volume", type=float, default=0.5,
+                        help="queue volume, 1.0 lets opus songs skip encoding")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="voice worker processes (see MusicPlayer voice_workers)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        formats = (
+            ("mp3", ["-c:a", "libmp3lame", "-b:a", "192k"]),
+            ("opus", ["-c:a", "libopus", "-b:a", "128k", "-f", "ogg"]),
+        )
+
+        for audio_format, codec_options in formats:
+            path = os.path.join(directory, "song.%s" %(audio_format))
+            convert(args.song, path, codec_options)
+
+            player = erina.MusicPlayer(songs_dir=directory, audio_format=audio_format,
+                                        voice_workers=args.workers)
+
+            cpu = children_cpu()
+
+            try:
+                stats, elapsed = asyncio.run(play_streams(player, path, args.streams,
+                                                            args.frames, args.volume))
+
+            finally:
+                # the index save timers would fire after the directory is removed
+                player.cache.flush()
+                player.metadata.flush()
+
+            # worker processes CPU is counted once they exit
+            if player.workers:
+                player.workers.close()
+
+            report("%s x%i" %(audio_format, args.streams), stats,
+                    children_cpu() - cpu, elapsed)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+'''
+Removes the duplicated songs the example bot (main.py) saved before songs
+were stored by video id, one document per video is kept. Run it once:
+
+    $ python3 compact_songs.py
+'''
+import ErinaBot as erina
+
+songs = erina.SongStore(erina.db.songs)
+
+kept, removed = songs.compact()
+songs.create_indexes()
+
+print("Songs: %i Duplicates removed: %i" %(kept, removed))
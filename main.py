@@ -8,17 +8,24 @@ import discord
 import ErinaBot as erina
 
 from datetime import datetime
-from discord.ext import tasks
 from unidecode import unidecode
 
 
 ACCESS_TOKEN = os.environ['DISCORD_BOT_TOKEN']
 
-client = discord.Client()
+class ErinaClient(discord.Client):
+    async def close(self):
+        await super().close()
+        # the shared HTTP session is closed with the bot
+        await erina.http.close()
+
+client = ErinaClient()
 
 erina.conversation.load_dictionary("intentions.yml")
 erina.conversation.load_dictionary("dialogs.yml")
 
+song_store = erina.SongStore(erina.db.songs)
+
 @erina.intention
 async def help(ctx, args):
     '''
@@ -33,7 +40,7 @@ async def help(ctx, args):
     pass
 
 @erina.intention
-async def list_downloaded_songs(ctx, message):
+async def list_downloaded_songs(ctx, args):
     '''
         **Listar las canciones descargadas**
 
@@ -42,22 +49,34 @@ async def list_downloaded_songs(ctx, message):
         :black_small_square: ¿Eri qué canciones has descargado?
         :black_small_square: Eri lista de canciones descargadas
 
+        Si son muchas puedes pedir otra página o buscar una por su nombre:
+
+        :black_small_square: Eri lista de canciones descargadas 2
+        :black_small_square: Eri canciones descargadas "metallica"
+
         De la lista que aparezca puedes pedir una canción:
 
         :black_small_square: Eri pon la 3
         :black_small_square: quiero escuchar la 5 eri
     '''
-    songs = erina.music.list_downloaded_songs()
+    if args.string:
+        songs = erina.music.search_downloaded_songs(args.string)
+        title = "%i Canciones descargadas con \"%s\"" %(len(songs), args.string)
+
+    else:
+        page = max(args.number or 1, 1) - 1
+        songs, pages = erina.music.list_downloaded_songs(page)
+        title = "%i Canciones descargadas (página %i de %i)" %(len(erina.music.cache), page + 1, pages)
 
-    string = "".join("**%s** - %s\n" %(i, songs[i]) for i in range(len(songs)))
+    string = "".join("**%s** - %s\n" %(i, songs[i]['title']) for i in range(len(songs)))
 
-    embed = discord.Embed(title="%i Canciones descargadas" %(len(songs)),
+    embed = discord.Embed(title=title,
                             description=string,
                             color=discord.Color.purple())
 
     await ctx.channel.send(embed=embed)
 
-    erina.conversation.set_context_var(ctx, "downloaded_songs", songs)
+    erina.conversation.set_context_var(ctx, "downloaded_songs", [song['key'] for song in songs])
     erina.conversation.set_context_var(ctx, "yt_search_result", '')
 
 @erina.intention
@@ -84,7 +103,7 @@ async def yt_search(ctx, args):
     await ctx.channel.send("Buscando **%s** :face_with_monocle:" %(args.string))
 
     async with ctx.channel.typing():
-        videos = erina.music.search_yt_video(args.string)
+        videos = await erina.music.search_yt_video_async(args.string)
 
     if len(videos) == 0:
         await ctx.channel.send("Lo siento tuve problemas con la busqueda :sweat_smile:")
@@ -122,8 +141,8 @@ async def play_music(ctx, args):
         return
 
     video_url = None
-    song_path = None
-    song_metadata = None
+    video_title = None
+    song_key = None
 
     if args.yt_url:
         video_url = args.yt_url
@@ -133,23 +152,25 @@ async def play_music(ctx, args):
             await ctx.channel.send("Weyyy nooooo! la cancion! :sob::ok_hand::ok_hand::ok_hand:")
 
         async with ctx.channel.typing():
-            search_results = erina.music.search_yt_video(args.string)
+            search_results = await erina.music.search_yt_video_async(args.string)
 
         if len(search_results) == 0:
             await ctx.channel.send("Lo siento no pude encontrar tu rolita :C")
             return
 
         video_url = search_results[0]['url']
+        video_title = search_results[0]['name']
 
     elif args.number != None:
-        songs = erina.conversation.get_context_var(ctx, "downloaded_songs")
-        videos = erina.conversation.get_context_var(ctx, "yt_search_result")
+        songs = await erina.conversation.get_context_var_async(ctx, "downloaded_songs")
+        videos = await erina.conversation.get_context_var_async(ctx, "yt_search_result")
 
         if videos:
             video_url = videos[args.number]['url']
+            video_title = videos[args.number]['name']
 
         elif songs:
-            song_path = "songs/%s" %(songs[args.number])
+            song_key = songs[args.number]
 
         else:
             await ctx.channel.send("Primero realiza una busqueda :thinking:")
@@ -160,29 +181,19 @@ async def play_music(ctx, args):
         return
 
     if video_url:
-        async with ctx.channel.typing():
-            await ctx.channel.send("Dame un segundo, necesito descargarla...")
-            song_path, song_title, song_thumbnail = erina.music.download_yt_video(video_url)
-
-            song_metadata = {
-                "path": song_path,
-                "title": song_title,
-                "thumbnail": song_thumbnail,
-                "url": video_url,
-                "requested_by": ctx.author.mention
-            }
-
-            erina.db.songs.insert_one(song_metadata)
-
-    if not song_path:
-        await ctx.add_reaction("😢")
-        await ctx.channel.send("Los siento no pude encontrarla :C")
-        return
+        # the queue downloads it in background, saved once it is downloaded
+        erina.music.enqueue(client, ctx, voice_channel, video_url, video_title,
+                            on_resolved=song_store.save_async)
+
+    else:
+        song_metadata = erina.music.get_downloaded_song(song_key, ctx.author.mention)
 
-    if not song_metadata:
-        song_metadata = erina.db.songs.find_one({"path": song_path})
+        if not song_metadata:
+            await ctx.add_reaction("😢")
+            await ctx.channel.send("Los siento no pude encontrarla :C")
+            return
 
-    erina.music.play(client, ctx, voice_channel, song_metadata)
+        erina.music.play(client, ctx, voice_channel, song_metadata)
 
     queue_info = erina.music.get_queue_info(voice_channel)
 
@@ -346,7 +357,7 @@ async def covid_statistics(ctx, args):
     await ctx.channel.send("Voy, dame un segundo...")
 
     async with ctx.channel.typing():
-        covid_cases = erina.utils.covid_cases(args.string)
+        covid_cases = await erina.utils.covid_cases(args.string)
 
     embed = discord.Embed(title="Casos de covid en %s" %(args.string),
                             description=covid_cases,
@@ -365,7 +376,7 @@ async def send_nudes(ctx, args):
     await ctx.channel.send("Pinshi puerco... espera 7u7r")
 
     async with ctx.channel.typing():
-        url, thumbnail = erina.utils.get_nudes()
+        url, thumbnail = await erina.utils.get_nudes()
 
     embed = (discord.Embed(title=":smiling_imp:",
                             description="[Ver Imagen Completa](%s)" %(url),
@@ -419,7 +430,8 @@ async def create_reminder(ctx, args):
         'creation_date': creation_date
     }
 
-    erina.db.notifications.insert_one(notification)
+    await erina.database.notifications.insert_one(notification)
+    reminders.add(notification)
 
     await ctx.add_reaction("👍")
     await ctx.channel.send("Vale yo te aviso :sunglasses:")
@@ -445,7 +457,7 @@ async def send_meme(ctx, args):
     await ctx.channel.send("Deja busco uno que este bueno :'3 ...")
 
     async with ctx.channel.typing():
-        await ctx.channel.send(erina.utils.get_meme())
+        await ctx.channel.send(await erina.utils.get_meme())
 
 @erina.intention
 async def send_joke(ctx, args):
@@ -459,33 +471,26 @@ async def send_joke(ctx, args):
     await ctx.channel.send("Mmm ...")
 
     async with ctx.channel.typing():
-        await ctx.channel.send(erina.utils.get_joke())
+        await ctx.channel.send(await erina.utils.get_joke())
 
-@tasks.loop(seconds=30.0)
-async def cronjob():
+async def send_reminder(notification):
     '''
-        Revisa la base de datos cada 30s y si encuentra una notificacion
-        que haya expirado la envia al canal donde la crearon.
+        Envia una notificacion que ya expiro al canal donde la crearon.
     '''
-    notifications = erina.db.notifications.find()
-    unix_time = time.time()
-
-    for notification in notifications:
-        if notification['expiration'] <= unix_time:
-            erina.db.notifications.delete_one({'_id': notification['_id']})
+    channel_id = notification['channel']
+    channel = client.get_channel(channel_id)
 
-            channel_id = notification['channel']
-            channel = client.get_channel(channel_id)
+    author = notification['author']
+    message = notification['message']
+    creation_date = notification['creation_date']
 
-            author = notification['author']
-            message = notification['message']
-            creation_date = notification['creation_date']
+    embed = (discord.Embed(title="Recodatorio", description=message, color=discord.Color.purple())
+            .add_field(name="Hace", value=creation_date)
+            .add_field(name="Autor", value=author))
 
-            embed = (discord.Embed(title="Recodatorio", description=message, color=discord.Color.purple())
-                    .add_field(name="Hace", value=creation_date)
-                    .add_field(name="Autor", value=author))
+    await channel.send(embed=embed)
 
-            await channel.send(embed=embed)
+reminders = erina.ReminderScheduler(erina.database.notifications, send_reminder)
 
 @client.event
 async def on_ready():
@@ -493,7 +498,10 @@ async def on_ready():
     activity = discord.Activity(type=discord.ActivityType.watching, name="Hentai!")
     await client.change_presence(status=discord.Status.online, activity=activity)
 
-    cronjob.start()
+    reminders.start(client.loop)
+    client.loop.create_task(song_store.create_indexes_async())
+    erina.utils.prefill()
+    erina.conversation.watch_dictionaries(client.loop)
 
 @client.event
 async def on_message(message):
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+'''
+Converts the songs downloaded by the example bot (songs/) to Ogg/Opus and
+updates their paths in the database. After running it make the bot
+download Opus songs too (main.py):
+
+    erina.music = erina.MusicPlayer(audio_format="opus")
+'''
+import sys
+
+import ErinaBot as erina
+
+songs = erina.SongStore(erina.db.songs)
+songs.create_indexes()
+
+bitrate = sys.argv[1] if len(sys.argv) > 1 else "128k"
+
+converted, failed = erina.music.convert_songs_to_opus(bitrate, songs.update_path)
+
+print("Converted songs: %i Failed: %i" %(converted, failed))
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import asyncio
+import subprocess
+
+import pytest
+
+from aiohttp import web
+
+from ErinaBot import _music_player
+
+requires_ffmpeg = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="FFmpeg is not installed")
+
+VIDEO_ID = "dQw4w9WgXcQ"
+VIDEO_URL = "https://www.youtube.com/watch?v=%s" %(VIDEO_ID)
+
+
+class StubServer():
+    '''
+    Local HTTP server for the tests. *routes* maps a path to a handler, every
+    request is counted by path.
+    '''
+    def __init__(self, routes):
+        self.routes = routes
+        self.requests = {}
+        self.runner = None
+        self.url = None
+
+    async def start(self):
+        app = web.Application()
+
+        for path, handler in self.routes.items():
+            app.router.add_get(path, self.__counted(path, handler))
+
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = "http://127.0.0.1:%i" %(port)
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    def __counted(self, path, handler):
+        async def handle(request):
+            self.requests[path] = self.requests.get(path, 0) + 1
+            return await handler(request)
+
+        return handle
+
+
+def make_song(path, seconds=2):
+    '''
+    Writes a sine wave song, the format is taken from the extension.
+    '''
+    subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-f", "lavfi",
+                    "-i", "sine=frequency=440:duration=%i" %(seconds), path], check=True)
+    return path
+
+
+@pytest.fixture
+def song_server(tmp_path):
+    '''
+    Serves a 2 seconds song in /song.wav (as YouTube would serve a stream).
+    *song_server.fetches* counts the requests from the start of the file,
+    FFmpeg also makes range requests to skip the wav header.
+    '''
+    song = make_song(str(tmp_path / "song.wav"))
+
+    async def handler(request):
+        if request.headers.get('Range', "bytes=0-").startswith("bytes=0-"):
+            server.fetches += 1
+
+        return web.FileResponse(song)
+
+    server = StubServer({'/song.wav': handler})
+    server.fetches = 0
+
+    return server
+
+
+@pytest.fixture
+def fake_youtube(monkeypatch):
+    '''
+    Replaces the youtube_dl extraction (no network), the stream url is set
+    with *fake_youtube.stream_url*.
+    '''
+    class FakeYoutubeDL():
+        stream_url = None
+        extractions = 0
+
+        def __init__(self, options=None):
+            self.options = options
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc_info):
+            pass
+
+        def extract_info(self, url, download=False):
+            assert not download, "songs must be streamed, not downloaded"
+            FakeYoutubeDL.extractions += 1
+
+            return {
+                'id': VIDEO_ID,
+                'title': "Test song",
+                'thumbnail': None,
+                'duration': 2,
+                'webpage_url': VIDEO_URL,
+                'url': FakeYoutubeDL.stream_url,
+            }
+
+    monkeypatch.setattr(_music_player.youtube_dl, "YoutubeDL", FakeYoutubeDL)
+    return FakeYoutubeDL
+
+
+@pytest.fixture
+def player(tmp_path):
+    player = _music_player.MusicPlayer(songs_dir=str(tmp_path / "songs"))
+    yield player
+    player.cache.flush()
+    player.metadata.flush()
+    player.executor.shutdown()
+
+
+def source_input(source):
+    '''
+    The FFmpeg input of an audio source.
+    '''
+    source = getattr(source, 'original', source)
+    args = source._process.args
+    return args[args.index('-i') + 1]
+
+
+def part_files(player):
+    return [name for name in os.listdir(player.cache.directory) if name.endswith(".part")]
+
+
+async def read_all(source, frames=None):
+    '''
+    Reads the frames of a source (in a thread, like the voice client) and
+    cleans it up.
+
+    Returns:
+        int: Frames read.
+    '''
+    def read():
+        count = 0
+
+        try:
+            while frames is None or count < frames:
+                if not source.read():
+                    break
+
+                count += 1
+
+        finally:
+            source.cleanup()
+
+        return count
+
+    return await asyncio.get_event_loop().run_in_executor(None, read)
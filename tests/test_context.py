@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+import time
+import asyncio
+import threading
+
+from pymongo import DeleteOne
+
+from ErinaBot import MongoContextStore
+
+
+class FakeCollection():
+    '''
+    The few collection methods the context store uses, in memory. Bulk
+    writes wait for *release* if it is set, like a slow database.
+    '''
+    def __init__(self):
+        self.documents = {}
+        self.reads = 0
+        self.release = None
+
+    def create_index(self, *args, **kwargs):
+        pass
+
+    def find_one(self, query):
+        self.reads += 1
+        document = self.documents.get((query['channel'], query['var']))
+        return dict(document) if document else None
+
+    def bulk_write(self, operations, ordered=True):
+        if self.release:
+            self.release.wait(5)
+
+        for operation in operations:
+            key = (operation._filter['channel'], operation._filter['var'])
+
+            if isinstance(operation, DeleteOne):
+                self.documents.pop(key, None)
+
+            else:
+                self.documents[key] = dict(operation._filter, **operation._doc['$set'])
+
+    def delete_many(self, query):
+        for key in [key for key in self.documents if key[0] == query['channel']]:
+            del self.documents[key]
+
+
+def test_stored_none_is_cached():
+    collection = FakeCollection()
+    store = MongoContextStore(collection)
+
+    async def run():
+        store.set(1, "search", None)
+        await store.flush_async()
+        store.cache.clear(1)
+
+        assert await store.get_async(1, "search", "default") is None
+        assert await store.get_async(1, "search", "default") is None
+
+    asyncio.run(run())
+
+    # the second read is answered by the local cache
+    assert collection.reads == 1
+
+
+def test_clear_waits_for_the_flush_in_flight():
+    collection = FakeCollection()
+    collection.release = threading.Event()
+    store = MongoContextStore(collection)
+
+    async def run():
+        store.set(1, "search", ["a", "b"])
+        flush = asyncio.ensure_future(store.flush_async())
+
+        # the bulk write is in the executor, waiting for the database
+        await asyncio.sleep(0.05)
+        clear = asyncio.ensure_future(store.clear_async(1))
+        await asyncio.sleep(0.05)
+
+        assert await store.get_async(1, "search", "default") == "default"
+
+        collection.release.set()
+        await asyncio.gather(flush, clear)
+
+        return await store.get_async(1, "search", "default")
+
+    started = time.monotonic()
+
+    assert asyncio.run(run()) == "default"
+    assert collection.documents == {}
+    assert time.monotonic() - started < 5
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+from ErinaBot import utils, _extract
+
+PAGES = os.path.join(os.path.dirname(__file__), "fixtures", "pages")
+
+
+def page(name):
+    with open(os.path.join(PAGES, name), encoding='utf-8') as f:
+        return f.read()
+
+
+def test_covid_table():
+    table = utils.parse_covid_table(page("covid.html"))
+
+    # header row and 200 countries, the footer row has a single cell
+    assert len(table) == 201
+    assert table['mexico'][0] == "Mexico"
+    assert all(len(row) == 5 for row in table.values())
+
+
+def test_posts():
+    posts = utils.parse_posts(page("posts.xml"))
+
+    assert len(posts) == 50
+    assert all(file_url.startswith("https://img.rule34.xxx/images/") and
+                preview_url.startswith("https://img.rule34.xxx/thumbnails/")
+                for file_url, preview_url in posts)
+
+
+def test_memes_are_plain_strings():
+    memes = utils.parse_memes(page("memes.html"))
+
+    assert len(memes) == 12
+    # lxml smart strings would keep the whole page alive in the memes pool
+    assert all(type(meme) is str for meme in memes)
+
+
+def test_jokes():
+    jokes = utils.parse_jokes(page("jokes.html"))
+
+    assert len(jokes) == 1 and type(jokes[0]) is str
+    assert "<br" not in jokes[0]
+
+
+def test_yt_results():
+    results = _extract.yt_results(page("yt.html"))
+
+    assert len(results) == 10
+    assert results[0][0].startswith("/watch?v=")
+    assert [href.split("/")[1].split("?")[0] for href, _ in results].count("channel") == 1
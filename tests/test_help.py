@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+from ErinaBot import _conversation
+from ErinaBot._conversation import _help_pages
+
+
+def test_help_docs_are_dedented_and_joined():
+    async def help_test(msg, args):
+        '''
+        **Reproducir música**
+
+            :black_small_square: Eri pon one de metallica
+        '''
+
+    help = list(_conversation.intentions_help)
+    embeds = list(_conversation.help_embeds)
+
+    try:
+        _conversation.handle_intention(help_test)
+
+        assert _conversation.intentions_help[-1] == \
+            "**Reproducir música**\n\n    :black_small_square: Eri pon one de metallica"
+
+    finally:
+        _conversation.intentions_help[:] = help
+        _conversation.help_embeds[:] = embeds
+        _conversation.intention_callbacks.pop('help_test', None)
+
+
+def test_help_pages():
+    helps = ["a" * 1000, "b" * 1000, "c" * 1000]
+
+    assert _help_pages(helps, size=2100) == ["a" * 1000 + "\n\n" + "b" * 1000, "c" * 1000]
+
+    # docs longer than a page are splitted by lines
+    pages = _help_pages(["line\n" * 100], size=100)
+
+    assert all(len(page) <= 100 for page in pages)
+    assert "".join(pages).count("line") == 100
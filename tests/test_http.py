@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+import time
+import asyncio
+
+import pytest
+
+from aiohttp import web, ClientResponseError
+
+from conftest import StubServer
+from ErinaBot import HTTPClient
+
+
+def responses(*sequence):
+    '''
+    Handler answering with (status, delay) responses in order, the last one
+    repeats.
+    '''
+    count = 0
+
+    async def handle(request):
+        nonlocal count
+        status, delay = sequence[min(count, len(sequence) - 1)]
+        count += 1
+
+        if delay:
+            await asyncio.sleep(delay)
+
+        return web.Response(status=status, text="%s %s" %(request.path, request.query_string))
+
+    return handle
+
+
+def run(routes, check):
+    '''
+    Runs *check* with a client and a stub server serving *routes*.
+    '''
+    async def main():
+        async with StubServer(routes) as server:
+            client = HTTPClient(timeout=0.3, retries=2, backoff=0.05)
+
+            try:
+                return await check(client, server)
+
+            finally:
+                await client.close()
+
+    return asyncio.run(main())
+
+
+def test_5xx_and_429_are_retried_with_backoff():
+    async def check(client, server):
+        start = time.perf_counter()
+        text = await client.get_text(server.url + "/unavailable")
+        elapsed = time.perf_counter() - start
+
+        assert text == "/unavailable "
+        assert server.requests['/unavailable'] == 3
+        # 0.05 + 0.1 seconds between the three requests
+        assert elapsed >= 0.15
+
+        assert await client.get_text(server.url + "/throttled") == "/throttled "
+        assert server.requests['/throttled'] == 2
+
+    run({'/unavailable': responses((503, 0), (503, 0), (200, 0)),
+         '/throttled': responses((429, 0), (200, 0))}, check)
+
+
+def test_persistent_errors_raise_after_the_retries():
+    async def check(client, server):
+        with pytest.raises(ClientResponseError):
+            await client.get_text(server.url + "/broken")
+
+        with pytest.raises(asyncio.TimeoutError):
+            await client.get_text(server.url + "/slow")
+
+        assert server.requests == {'/broken': 3, '/slow': 3}
+        assert client.stats() == {'requests': 6, 'retried': 4, 'failures': 2}
+
+    run({'/broken': responses((500, 0)), '/slow': responses((200, 1.0))}, check)
+
+
+def test_other_errors_are_not_retried():
+    async def check(client, server):
+        assert await client.get_text(server.url + "/missing") == "/missing "
+        assert server.requests['/missing'] == 1
+
+    run({'/missing': responses((404, 0))}, check)
+
+
+def test_query_parameters_and_connection_reuse():
+    connections = set()
+    ok = responses((200, 0))
+
+    async def handle(request):
+        connections.add(request.transport.get_extra_info('peername'))
+        return await ok(request)
+
+    async def check(client, server):
+        text = await client.get_text(server.url + "/ok", params={'search_query': "metallica one"})
+        assert text == "/ok search_query=metallica one"
+
+        for _ in range(5):
+            await client.get_text(server.url + "/ok")
+
+        assert len(connections) == 1
+
+    run({'/ok': handle}, check)
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+import random
+import string
+import tracemalloc
+
+import Levenshtein
+
+from ErinaBot._matcher import distance_matrix
+
+
+def random_strings(count, max_length):
+    random.seed(count)
+    return ["".join(random.choices(string.ascii_lowercase + " ", k=random.randint(0, max_length)))
+                for _ in range(count)]
+
+
+def test_distance_matrix_fits_in_its_memory_budget():
+    texts = random_strings(100, 30)
+    phrases = random_strings(300, 60)
+    memory = 4 * 1024 ** 2
+
+    tracemalloc.start()
+
+    try:
+        distances = distance_matrix(texts, phrases, memory=memory)
+        peak = tracemalloc.get_traced_memory()[1]
+
+    finally:
+        tracemalloc.stop()
+
+    # the result matrix is allocated apart from the tables
+    assert peak - distances.nbytes <= memory
+    assert all(distances[i, j] == Levenshtein.distance(text, phrase)
+                for i, text in enumerate(texts) for j, phrase in enumerate(phrases))
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+
+from ErinaBot._song_cache import MetadataStore
+
+
+def info(video_id):
+    return {'id': video_id, 'title': "Song %s" %(video_id), 'thumbnail': None, 'duration': 2}
+
+
+def test_metadata_is_bounded_and_saved_in_batches(tmp_path):
+    path = str(tmp_path / "metadata.json")
+    store = MetadataStore(path, max_videos=3, save_delay=60)
+
+    for video_id in ("a", "b", "c"):
+        store.add(info(video_id))
+
+    # nothing is written until the timer fires or the store is flushed
+    assert not os.path.exists(path)
+
+    # "a" is used again, "b" is the least recently used
+    assert store.get("a")['title'] == "Song a"
+    store.add(info("d"))
+
+    assert len(store) == 3
+    assert store.get("b") is None
+
+    store.flush()
+
+    with open(path) as f:
+        assert list(json.load(f)) == ["c", "a", "d"]
+
+    assert MetadataStore(path).get("d")['url'] == "https://www.youtube.com/watch?v=d"
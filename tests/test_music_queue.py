@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import asyncio
+import threading
+
+from types import SimpleNamespace
+
+from conftest import requires_ffmpeg, make_song, source_input, part_files, VIDEO_ID, VIDEO_URL
+
+CACHED_ID = "9bZkp7q19f0"
+CACHED_URL = "https://www.youtube.com/watch?v=%s" %(CACHED_ID)
+
+
+class FakeVoiceClient():
+    '''
+    Plays sources like discord.VoiceClient (in a thread, *after* is called
+    before the source is cleaned up) without sending them anywhere.
+    '''
+    def __init__(self):
+        self.guild = SimpleNamespace(id=1)
+        self.source = None
+        self.inputs = []
+
+    def is_connected(self):
+        return True
+
+    def is_playing(self):
+        return False
+
+    def play(self, source, after):
+        self.source = source
+        self.inputs.append(source_input(source))
+        threading.Thread(target=self.__run, args=(source, after), daemon=True).start()
+
+    async def disconnect(self):
+        pass
+
+    def __run(self, source, after):
+        while source.read():
+            pass
+
+        after(None)
+        source.cleanup()
+
+
+class FakeTextChannel():
+    def __init__(self):
+        self.messages = []
+
+    async def send(self, content=None, embed=None):
+        self.messages.append(content or embed.title)
+
+
+async def wait_for(condition, seconds=10):
+    deadline = time.monotonic() + seconds
+
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.05)
+
+
+@requires_ffmpeg
+def test_queue_plays_cached_files_and_streams_unfinished_downloads(tmp_path, player,
+                                                                    song_server, fake_youtube):
+    # a cached song and a song youtube_dl is still writing (not in the cache)
+    os.makedirs(player.cache.directory, exist_ok=True)
+    cached_path = make_song(player.cache.path_for(CACHED_ID))
+    player.cache.add(CACHED_ID, "Cached song", None, 2)
+
+    song = make_song(str(tmp_path / "whole.mp3"))
+    downloading_path = player.cache.path_for(VIDEO_ID)
+
+    with open(song, 'rb') as f, open(downloading_path, 'wb') as partial:
+        partial.write(f.read()[:4096])
+
+    voice = FakeVoiceClient()
+    text = FakeTextChannel()
+
+    async def run():
+        async with song_server:
+            fake_youtube.stream_url = song_server.url + "/song.wav"
+
+            client = SimpleNamespace(loop=asyncio.get_event_loop())
+            ctx = SimpleNamespace(channel=text, author=SimpleNamespace(mention="@tester"))
+
+            player.enqueue(client, ctx, voice, CACHED_URL)
+            player.enqueue(client, ctx, voice, VIDEO_URL)
+
+            await wait_for(lambda: player.cache.find(path=downloading_path))
+
+            queue = player.queues[voice.guild.id]
+            queue.task.cancel()
+
+    asyncio.run(run())
+
+    # the cached song is played from its file, no extraction
+    assert voice.inputs[0] == cached_path
+    assert fake_youtube.extractions == 1
+
+    # the unfinished download is not trusted, the stream is played and recorded
+    assert voice.inputs[1] == song_server.url + "/song.wav"
+    assert os.path.getsize(downloading_path) > 4096
+    assert part_files(player) == []
+    assert player.cache.find(path=cached_path)['play_count'] == 1
+    assert player.cache.find(path=downloading_path)['play_count'] == 1
+    assert "Lo siento no pude descargar" not in " ".join(text.messages)
+
+    # played songs are not pinned in the cache anymore
+    assert player.cache.pinned == {}
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+import time
+import asyncio
+
+from ErinaBot import ReminderScheduler
+
+
+class FakeCollection():
+    '''
+    In memory reminders collection, it only understands the queries the
+    scheduler makes.
+    '''
+    def __init__(self, reminders):
+        self.documents = {reminder['_id']: dict(reminder) for reminder in reminders}
+
+    async def create_index(self, *args, **kwargs):
+        pass
+
+    async def find(self, query, sort=None):
+        if 'claim' in query:
+            found = [document for document in self.documents.values()
+                        if document.get('claim') == query['claim']]
+
+        else:
+            found = [document for document in self.documents.values()
+                        if document['expiration'] <= query['expiration']['$lte']]
+
+        return [dict(document) for document in found]
+
+    async def update_many(self, query, update):
+        now = query['expiration']['$lte']
+
+        for document in self.documents.values():
+            if document['expiration'] <= now and (document.get('claim') is None
+                                                    or document['lease'] <= now):
+                document.update(update['$set'])
+                document['attempts'] = document.get('attempts', 0) + 1
+
+    async def delete_many(self, query):
+        for _id in query['_id']['$in']:
+            if self.documents[_id]['claim'] == query['claim']:
+                del self.documents[_id]
+
+
+def test_failed_reminder_is_sent_again_when_its_lease_expires():
+    collection = FakeCollection([{'_id': 1, 'channel': 1, 'expiration': time.time()}])
+    attempts = []
+
+    async def deliver(reminder):
+        attempts.append(time.monotonic())
+
+        if len(attempts) == 1:
+            raise ConnectionError("discord is down")
+
+    async def run():
+        # the next sync is 5 minutes away
+        scheduler = ReminderScheduler(collection, deliver, lease=0.2)
+        task = scheduler.start(asyncio.get_event_loop())
+
+        while len(attempts) < 2 and time.monotonic() - started < 3:
+            await asyncio.sleep(0.02)
+
+        task.cancel()
+        return scheduler.stats()
+
+    started = time.monotonic()
+    stats = asyncio.run(run())
+
+    assert len(attempts) == 2
+    assert 0.15 <= attempts[1] - attempts[0] < 1
+    assert stats['delivered'] == 1 and stats['failed'] == 1 and stats['syncs'] == 1
+    assert collection.documents == {}
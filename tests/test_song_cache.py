@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+import os
+
+from ErinaBot._song_cache import SongCache
+
+
+def write(path, size):
+    with open(path, 'wb') as f:
+        f.write(b"\0" * size)
+
+    return path
+
+
+def test_cold_load_adopts_only_songs(tmp_path):
+    write(str(tmp_path / "Old song.mp3"), 10)
+    write(str(tmp_path / "Converted song.opus"), 10)
+
+    # youtube_dl files of a download that didn't finish
+    write(str(tmp_path / "dQw4w9WgXcQ.webm"), 10)
+    write(str(tmp_path / "dQw4w9WgXcQ.webm.part"), 10)
+    write(str(tmp_path / "dQw4w9WgXcQ.ytdl"), 10)
+
+    cache = SongCache(str(tmp_path), save_delay=60)
+
+    assert sorted(song['title'] for song in cache.songs()) == ["Converted song", "Old song"]
+    cache.flush()
+
+
+def test_pinned_songs_are_not_evicted(tmp_path):
+    cache = SongCache(str(tmp_path), max_size=25, save_delay=60)
+
+    for video_id in ("aaaaaaaaaaa", "bbbbbbbbbbb"):
+        write(cache.path_for(video_id), 10)
+        cache.add(video_id, video_id, None)
+
+    # the oldest song is queued
+    cache.pin(cache.path_for("aaaaaaaaaaa"))
+
+    write(cache.path_for("ccccccccccc"), 10)
+    cache.add("ccccccccccc", "ccccccccccc", None)
+
+    assert cache.find(path=cache.path_for("aaaaaaaaaaa"))
+    assert cache.find(path=cache.path_for("bbbbbbbbbbb")) is None
+    assert not os.path.exists(cache.path_for("bbbbbbbbbbb"))
+
+    # once it plays it can be evicted
+    cache.unpin(cache.path_for("aaaaaaaaaaa"))
+
+    write(cache.path_for("ddddddddddd"), 10)
+    cache.add("ddddddddddd", "ddddddddddd", None)
+
+    assert cache.find(path=cache.path_for("aaaaaaaaaaa")) is None
+    assert cache.pinned == {}
+    cache.flush()
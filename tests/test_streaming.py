@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+import os
+import asyncio
+
+from conftest import requires_ffmpeg, VIDEO_ID, VIDEO_URL, source_input, part_files, read_all
+
+
+def pending_song():
+    return {'path': None, 'title': VIDEO_URL, 'thumbnail': None, 'url': VIDEO_URL,
+            'requested_by': "@tester"}
+
+
+@requires_ffmpeg
+def test_streamed_song_is_recorded_to_the_cache(player, song_server, fake_youtube):
+    saved = []
+
+    async def run():
+        async with song_server:
+            fake_youtube.stream_url = song_server.url + "/song.wav"
+            metadata = pending_song()
+
+            assert await player.resolve_song(metadata, saved.append)
+            assert metadata['stream_url'] == fake_youtube.stream_url
+            assert player.cache.find(path=metadata['path']) is None
+
+            source = player.create_source(metadata)
+            assert source_input(source) == fake_youtube.stream_url
+
+            frames = await read_all(source)
+            added = await player.finish_recording_async(metadata, source, saved.append)
+
+            return metadata, frames, added
+
+    metadata, frames, added = asyncio.run(run())
+
+    # 2 seconds, 20ms frames
+    assert 95 <= frames <= 101
+    assert added
+    assert player.cache.find(path=metadata['path'])['id'] == VIDEO_ID
+    assert os.path.getsize(metadata['path']) > 0
+    assert part_files(player) == []
+    assert [song['path'] for song in saved] == [metadata['path']]
+
+    # the audio was fetched once, by the FFmpeg that played it
+    assert song_server.fetches == 1
+
+
+@requires_ffmpeg
+def test_cached_song_is_not_streamed_again(player, song_server, fake_youtube):
+    async def run():
+        async with song_server:
+            fake_youtube.stream_url = song_server.url + "/song.wav"
+
+            first = pending_song()
+            await player.resolve_song(first)
+            source = player.create_source(first)
+            await read_all(source)
+            await player.finish_recording_async(first, source)
+
+            second = pending_song()
+            await player.resolve_song(second)
+            source = player.create_source(second)
+            played = source_input(source)
+            source.cleanup()
+
+            return second, played
+
+    metadata, played = asyncio.run(run())
+
+    assert 'stream_url' not in metadata
+    assert played == metadata['path']
+    assert fake_youtube.extractions == 1
+    assert song_server.fetches == 1
+
+
+@requires_ffmpeg
+def test_skipped_stream_is_not_cached(player, song_server, fake_youtube):
+    async def run():
+        async with song_server:
+            fake_youtube.stream_url = song_server.url + "/song.wav"
+            metadata = pending_song()
+
+            await player.resolve_song(metadata)
+            source = player.create_source(metadata)
+
+            # skipped after 10 frames
+            await read_all(source, frames=10)
+            return metadata, await player.finish_recording_async(metadata, source)
+
+    metadata, added = asyncio.run(run())
+
+    assert not added
+    assert player.cache.find(path=metadata['path']) is None
+    assert not os.path.exists(metadata['path'])
+    assert part_files(player) == []